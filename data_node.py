@@ -1,13 +1,70 @@
 import os
 import sys
+import errno
 import shutil
-from typing import Optional, Tuple, List
-from urllib.request import urlopen, URLError, HTTPError
-from urllib.parse import urljoin, urlparse
+import time
+import tempfile
+from stat import S_ISDIR
+from threading import Lock
+from functools import lru_cache, wraps
+from typing import Optional, Tuple, List, Dict, BinaryIO, Union, Callable
+from urllib.request import URLError, HTTPError
+from urllib.parse import urljoin, urlsplit
 
 from util import *
 
 
+@lru_cache(maxsize=4096)
+def _resolve(fs_root: str, workdir: str, path: str) -> str:
+    """
+    Resolve path relative to working directory into path on host
+    filesystem. Results are cached since same paths are resolved
+    over and over by clients.
+
+    Paths without '.' or '..' segments only need duplicate slashes
+    collapsed, so full normalization is done only when such segments
+    are present.
+
+    Parameters
+    ----------
+    fs_root : str
+        Path to the root of virtual filesystem.
+    workdir : str
+        Current working directory inside virtual filesystem.
+    path : str
+        Relative or absolute path inside virtual filesystem.
+
+    Returns
+    -------
+    str:
+        Path on host filesystem.
+    """
+    if '/.' in '/' + path:
+        path = path_join('/', workdir.strip('/'), path).strip('/')
+        return fs_root + '/' + path if path else fs_root
+    if path[:1] != '/':
+        path = workdir + '/' + path
+    while '//' in path:
+        path = path.replace('//', '/')
+    return fs_root + path.rstrip('/')
+
+
+def _modifies(method: Callable) -> Callable:
+    """
+    Wrap DataNode method that modifies filesystem, so that stat cache
+    is cleared once modification is done, whether it succeeded or not.
+    Cache cleared before modification could be filled with old state
+    again by request served concurrently.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._stat_cache.clear()
+    return wrapper
+
+
 class DataNode:
     """
     Python API for direct interaction with filesystem. Isolates all
@@ -17,12 +74,46 @@ class DataNode:
 
     Class Attributes
     ----------------
+    DF_CACHE_TTL : float
+        Seconds during which df result is reused without querying
+        filesystem again.
+    STAT_CACHE_TTL : float
+        Seconds during which stat result of path, including absence
+        of path, is reused. Cache is also cleared after every
+        operation that modifies filesystem.
+    STAT_CACHE_SIZE : int
+        Maximum number of paths in stat cache.
+    SYNC_TIMEOUT : float
+        Socket timeout of requests to peers, long enough for donor to
+        build manifest or snapshot of whole filesystem.
     HANDLERS : dict
         Dictionary where keys are HTTP endpoints and values are tuples
         of three elements: method to call, argument deserialization
         routine and return value serialization routine.
     """
 
+    __slots__ = (
+        '_fs_root',
+        '_fs_root_len',
+        '_workdir',
+        '_df_cache',
+        '_root_fd',
+        '_root_lock',
+        '_stat_cache',
+        '_state_file',
+        '_advertise_host',
+        '_public_url',
+        '_advertise_port',
+        '_namenode_url',
+        '_id',
+        '_http',
+    )
+
+    DF_CACHE_TTL = 0.5
+    SYNC_TIMEOUT = 600.0
+    STAT_CACHE_TTL = 0.2
+    STAT_CACHE_SIZE = 4096
+
     @staticmethod
     def get_args(env: os.environ) -> tuple:
         """
@@ -77,17 +168,32 @@ class DataNode:
             or ambiguous network.
         """
         self._fs_root = fs_root.rstrip('/')
+        self._fs_root_len = len(self._fs_root)
         self._workdir = '/'
+        self._df_cache = None
+        self._root_fd = None
+        self._root_lock = Lock()
+        self._stat_cache = {}
+        self._http = ConnectionPool(self.SYNC_TIMEOUT)
         self._state_file = self._fs_root + '.state'
         self._advertise_host = advertise_host
         self._public_url = public_url
         self._advertise_port = port
         self._namenode_url = None
         self._id = None
-        if os.path.isfile(self._state_file):
-            with open(self._state_file, 'r') as f:
-                self._id, self._namenode_url = f.read().split()
-                return
+        try:
+            with open(self._state_file, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            pass
+        else:
+            nl = data.find(b'\n')
+            if nl == -1:
+                self._id = data.decode()
+            else:
+                self._id = data[:nl].decode()
+                self._namenode_url = data[nl + 1:].decode() or None
+            return
         self._id = gen_id()
         if namenode_url:
             if not self._advertise_port:
@@ -96,29 +202,119 @@ class DataNode:
                     'when running in cluster mode'
                 )
             self.join_namespace(namenode_url)
-        with open(self._state_file, 'w') as f:
-            f.write(self._id)
-            f.write('\n')
-            f.write(self._namenode_url)
+        self._save_state()
 
-    def _path_to_fs(self, path: str) -> str:
-        return path_join(
-            self._fs_root,
-            path_join('/', self._workdir.strip('/'), path).strip('/')
+    def close(self):
+        """
+        Close descriptor of filesystem root directory. Safe to call
+        more than once.
+        """
+        with self._root_lock:
+            if self._root_fd is not None:
+                os.close(self._root_fd)
+                self._root_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _save_state(self):
+        tmp_file = self._state_file + '.tmp'
+        data = f'{self._id}\n{self._namenode_url or ""}'.encode()
+        fd = os.open(
+            tmp_file,
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC,
+            0o600,
         )
+        try:
+            os.write(fd, data)
+            fdatasync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_file, self._state_file)
+
+    def _path_to_fs(self, path: str) -> str:
+        return _resolve(self._fs_root, self._workdir, path)
 
     def _fs_to_path(self, fs_path: str) -> str:
-        return fs_path[len(self._fs_root):] or '/'
+        return fs_path[self._fs_root_len:] or '/'
+
+    def _fs_to_rel(self, fs_path: str) -> str:
+        return fs_path[self._fs_root_len + 1:] or '.'
+
+    def _root(self) -> int:
+        """
+        Return descriptor of filesystem root directory, opening it on
+        first use. Paths relative to it are passed to *at syscalls,
+        so kernel does not walk fs root prefix on every operation.
+
+        Descriptor number stays the same for life of node, mkfs points
+        it to new root directory in place, so that requests served in
+        other threads never use closed or reused descriptor.
+        """
+        fd = self._root_fd
+        if fd is None:
+            with self._root_lock:
+                if self._root_fd is None:
+                    self._root_fd = self._open_root()
+                fd = self._root_fd
+        return fd
+
+    def _open_root(self) -> int:
+        return os.open(self._fs_root, os.O_RDONLY | os.O_DIRECTORY)
+
+    def _opener(self, path: str, flags: int) -> int:
+        return os.open(path, flags, 0o666, dir_fd=self._root())
+
+    def _stat(self, fs_path: str) -> os.stat_result:
+        """
+        Stat path through short lived cache, which also remembers
+        paths that do not exist.
+
+        Raises
+        ------
+        FileNotFoundError:
+            If path does not exist.
+        """
+        now = time.monotonic()
+        hit = self._stat_cache.get(fs_path)
+        if hit and now - hit[0] < self.STAT_CACHE_TTL:
+            st = hit[1]
+        else:
+            try:
+                st = os.stat(self._fs_to_rel(fs_path), dir_fd=self._root())
+            except FileNotFoundError:
+                st = None
+            if len(self._stat_cache) >= self.STAT_CACHE_SIZE:
+                self._stat_cache.clear()
+            self._stat_cache[fs_path] = (now, st)
+        if st is None:
+            raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), fs_path,
+            )
+        return st
 
+    @_modifies
     def mkfs(self):
         """
         Create filesystem directory and force remove already directory
         if already exists. Reset working directory.
         """
-        if os.path.exists(self._fs_root):
-            shutil.rmtree(self._fs_root)
-        os.makedirs(self._fs_root)
-        self._workdir = '/'
+        with self._root_lock:
+            try:
+                shutil.rmtree(self._fs_root)
+            except FileNotFoundError:
+                pass
+            os.makedirs(self._fs_root, exist_ok=True)
+            if self._root_fd is not None:
+                fd = self._open_root()
+                try:
+                    os.dup2(fd, self._root_fd, inheritable=False)
+                finally:
+                    os.close(fd)
+            self._workdir = '/'
 
     def df(self) -> Tuple[int, int, int]:
         """
@@ -130,7 +326,17 @@ class DataNode:
             Tuple with attributes with three elements which are
             the amount of total, used and free space, in bytes.
         """
-        return shutil.disk_usage(self._fs_root)
+        now = time.monotonic()
+        if self._df_cache and now - self._df_cache[0] < self.DF_CACHE_TTL:
+            return self._df_cache[1]
+        st = os.statvfs(self._fs_root)
+        usage = (
+            st.f_blocks * st.f_frsize,
+            (st.f_blocks - st.f_bfree) * st.f_frsize,
+            st.f_bavail * st.f_frsize,
+        )
+        self._df_cache = (now, usage)
+        return usage
 
     def cd(self, path: str):
         """
@@ -142,9 +348,11 @@ class DataNode:
             New workdir path, relative or absolute
         """
         fs_path = self._path_to_fs(path)
-        if not os.path.exists(fs_path):
+        try:
+            st = self._stat(fs_path)
+        except FileNotFoundError:
             raise CommandError(f'{path} does not exist')
-        if not os.path.isdir(fs_path):
+        if not S_ISDIR(st.st_mode):
             raise CommandError(f'{path} is not a dir')
         self._workdir = self._fs_to_path(fs_path)
 
@@ -163,15 +371,52 @@ class DataNode:
         List[str]:
             Array of directory entry names.
         """
-        if path == None:
+        if path is None:
             path = ''
         fs_path = self._path_to_fs(path)
-        if not os.path.exists(fs_path):
+        try:
+            with os.scandir(fs_path) as it:
+                return [e.name for e in it]
+        except FileNotFoundError:
             raise CommandError(f'{path} does not exist')
-        if not os.path.isdir(fs_path):
+        except NotADirectoryError:
             raise CommandError(f'{path} is not a dir')
-        return os.listdir(fs_path)
 
+    def ls_stat(
+        self,
+        path: Optional[str] = None,
+    ) -> List[Tuple[str, int, int]]:
+        """
+        List contents of directory along with size and mode of each
+        entry, so that clients do not have to stat entries one by one.
+
+        Parameters
+        ----------
+        path : Optional[str]
+            Path to directory. If not specified current working
+            directory is used.
+
+        Returns
+        -------
+        List[Tuple[str, int, int]]:
+            Array of directory entry names, sizes in bytes and modes.
+        """
+        if path is None:
+            path = ''
+        fs_path = self._path_to_fs(path)
+        try:
+            with os.scandir(fs_path) as it:
+                entries = []
+                for e in it:
+                    st = e.stat(follow_symlinks=False)
+                    entries.append((e.name, st.st_size, st.st_mode))
+                return entries
+        except FileNotFoundError:
+            raise CommandError(f'{path} does not exist')
+        except NotADirectoryError:
+            raise CommandError(f'{path} is not a dir')
+
+    @_modifies
     def mkdir(self, path: str):
         """
         Create new directory.
@@ -182,10 +427,12 @@ class DataNode:
             Path to new directory.
         """
         fs_path = self._path_to_fs(path)
-        if os.path.exists(fs_path):
+        try:
+            os.makedirs(fs_path)
+        except FileExistsError:
             raise CommandError(f'{path} already exists')
-        os.makedirs(fs_path)
 
+    @_modifies
     def rmdir(self, path: str, force: Optional[bool] = False):
         """
         Remove directory if it has no entries.
@@ -200,16 +447,23 @@ class DataNode:
             False by default.
         """
         fs_path = self._path_to_fs(path)
-        if not os.path.exists(fs_path):
-            raise CommandError(f'{path} does not exist')
-        if not os.path.isdir(fs_path):
-            raise CommandError(f'{path} is not a dir')
         if fs_path == self._fs_root:
             raise CommandError(f'Cannot remove root dir')
-        if len(os.listdir(fs_path)) > 0 and not force:
+        try:
+            if force:
+                shutil.rmtree(fs_path)
+            else:
+                os.rmdir(fs_path)
+        except FileNotFoundError:
+            raise CommandError(f'{path} does not exist')
+        except NotADirectoryError:
+            raise CommandError(f'{path} is not a dir')
+        except OSError as e:
+            if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                raise
             raise CommandError(f'{path} is not empty')
-        shutil.rmtree(fs_path)
 
+    @_modifies
     def touch(self, path: str):
         """
         Create empty file if not exists.
@@ -220,7 +474,15 @@ class DataNode:
             Path to file.
         """
         fs_path = self._path_to_fs(path)
-        open(fs_path, 'a').close()
+        try:
+            os.close(self._opener(
+                self._fs_to_rel(fs_path),
+                os.O_WRONLY | os.O_CREAT,
+            ))
+        except FileNotFoundError:
+            raise CommandError(f'{path} does not exist')
+        except IsADirectoryError:
+            raise CommandError(f'{path} is a directory')
 
     def cat(self, path: str) -> bytes:
         """
@@ -236,13 +498,60 @@ class DataNode:
         bytes:
             Contents of file.
         """
+        with self.cat_stream(path) as file:
+            data = file.read()
+            drop_cache(file.fileno(), len(data))
+            return data
+
+    def cat_range(self, path: str, offset: int, size: int) -> bytes:
+        """
+        Read part of file contents.
+
+        Parameters
+        ----------
+        path : str
+            Path to file.
+        offset : int
+            Position in file to start reading from.
+        size : int
+            Maximum number of bytes to read.
+
+        Returns
+        -------
+        bytes:
+            Contents of file starting from offset. Shorter than size if
+            end of file is reached.
+        """
+        with self.cat_stream(path) as file:
+            return os.pread(file.fileno(), size, offset)
+
+    def cat_stream(self, path: str) -> BinaryIO:
+        """
+        Open file for reading, so that its contents can be streamed
+        to client without reading them to memory.
+
+        Parameters
+        ----------
+        path : str
+            Path to file.
+
+        Returns
+        -------
+        BinaryIO:
+            File opened in binary read mode. Caller has to close it.
+        """
         fs_path = self._path_to_fs(path)
-        if not os.path.exists(fs_path):
+        try:
+            file = open(self._fs_to_rel(fs_path), 'rb', opener=self._opener)
+        except FileNotFoundError:
             raise CommandError(f'{path} does not exist')
-        with open(fs_path, 'rb') as file:
-            return file.read()
+        except IsADirectoryError:
+            raise CommandError(f'{path} is a directory')
+        advise_sequential(file.fileno())
+        return file
 
-    def tee(self, path: str, data: bytes):
+    @_modifies
+    def tee(self, path: str, data: Union[bytes, BinaryIO]):
         """
         Write data to file. Remove all previous data.
 
@@ -250,13 +559,19 @@ class DataNode:
         ----------
         path : str
             Path to file.
-        data : bytes
-            Data to write.
+        data : Union[bytes, BinaryIO]
+            Data to write, or readable file-like object to stream data
+            from.
         """
         fs_path = self._path_to_fs(path)
-        with open(fs_path, 'wb') as file:
-            file.write(data)
+        try:
+            write_file(fs_path, data)
+        except FileNotFoundError:
+            raise CommandError(f'{path} does not exist')
+        except IsADirectoryError:
+            raise CommandError(f'{path} is a directory')
 
+    @_modifies
     def rm(self, path: str):
         """
         Remove file.
@@ -267,11 +582,12 @@ class DataNode:
             Path to file.
         """
         fs_path = self._path_to_fs(path)
-        if not os.path.exists(fs_path):
+        try:
+            os.remove(self._fs_to_rel(fs_path), dir_fd=self._root())
+        except FileNotFoundError:
             raise CommandError(f'{path} does not exist')
-        if os.path.isdir(fs_path):
+        except IsADirectoryError:
             raise CommandError(f'{path} is a directory')
-        os.remove(fs_path)
 
     def stat(self, path: str) -> Tuple[str, int, int]:
         """
@@ -289,11 +605,40 @@ class DataNode:
             Full path, size in bytes and mode.
         """
         fs_path = self._path_to_fs(path)
-        if not os.path.exists(fs_path):
+        try:
+            st = self._stat(fs_path)
+        except FileNotFoundError:
             raise CommandError(f'{path} does not exist')
-        st = os.stat(fs_path)
         return self._fs_to_path(fs_path), st.st_size, st.st_mode
 
+    def stat_batch(self, paths: List[str]) -> List[Tuple[str, str, int, int]]:
+        """
+        Get info about several files or directories in one request.
+        Paths that do not exist are omitted from result.
+
+        Parameters
+        ----------
+        paths : List[str]
+            Paths to files or directories.
+
+        Returns
+        -------
+        List[Tuple[str, str, int, int]]:
+            Requested path, full path, size in bytes and mode.
+        """
+        result = []
+        for path in paths:
+            fs_path = self._path_to_fs(path)
+            try:
+                st = self._stat(fs_path)
+            except FileNotFoundError:
+                continue
+            result.append(
+                (path, self._fs_to_path(fs_path), st.st_size, st.st_mode)
+            )
+        return result
+
+    @_modifies
     def cp(self, src: str, dst: str):
         """
         Copy file.
@@ -307,13 +652,26 @@ class DataNode:
         """
         abs_src = self._path_to_fs(src)
         abs_dst = self._path_to_fs(dst)
-        if not os.path.exists(abs_src):
-            raise CommandError(f'{src} does not exist')
-        shutil.copy(abs_src, abs_dst)
-
+        try:
+            copy_file(abs_src, abs_dst)
+        except FileNotFoundError as e:
+            if e.filename == abs_src:
+                raise CommandError(f'{src} does not exist')
+            parent = self._fs_to_path(os.path.dirname(abs_dst))
+            raise CommandError(f'{parent} does not exist')
+        except IsADirectoryError as e:
+            if e.filename == abs_src:
+                raise CommandError(f'{src} is a directory')
+            target = self._fs_to_path(e.filename)
+            raise CommandError(f'{target} is a directory')
+        except shutil.SameFileError:
+            raise CommandError(f'{src} and {dst} are the same file')
+
+    @_modifies
     def mv(self, src: str, dst: str):
         """
-        Move file.
+        Move file or directory. If dst is existing directory, src is
+        moved into it.
 
         Parameters
         ----------
@@ -324,32 +682,163 @@ class DataNode:
         """
         abs_src = self._path_to_fs(src)
         abs_dst = self._path_to_fs(dst)
-        if not os.path.exists(abs_src):
+        root = self._root()
+        rel_src = self._fs_to_rel(abs_src)
+        rel_dst = self._fs_to_rel(abs_dst)
+        try:
+            into_dir = S_ISDIR(os.stat(rel_dst, dir_fd=root).st_mode)
+        except (FileNotFoundError, NotADirectoryError):
+            into_dir = False
+        if into_dir:
+            abs_dst = os.path.join(abs_dst, os.path.basename(abs_src))
+            rel_dst = self._fs_to_rel(abs_dst)
+            dst = self._fs_to_path(abs_dst)
+            if os.path.lexists(abs_dst):
+                raise CommandError(f'{dst} already exists')
+        try:
+            os.rename(rel_src, rel_dst, src_dir_fd=root, dst_dir_fd=root)
+        except FileNotFoundError:
+            if os.path.lexists(abs_src):
+                parent = self._fs_to_path(os.path.dirname(abs_dst))
+                raise CommandError(f'{parent} does not exist')
             raise CommandError(f'{src} does not exist')
-        shutil.move(abs_src, abs_dst)
-
+        except OSError as e:
+            if e.errno in (errno.ENOTEMPTY, errno.EEXIST):
+                raise CommandError(f'{dst} already exists')
+            if e.errno == errno.EISDIR:
+                raise CommandError(f'{dst} is a directory')
+            if e.errno == errno.ENOTDIR:
+                raise CommandError(f'{dst} is not a dir')
+            if e.errno == errno.EINVAL:
+                raise CommandError(f'Cannot move {src} into itself')
+            if e.errno != errno.EXDEV or os.path.isdir(abs_src):
+                raise
+            copy_file(abs_src, abs_dst)
+            os.remove(abs_src)
+
+    @_modifies
     def sync(self, donor_url: str):
         """
         Synchronize filesystem state from donor data node.
 
+        Filesystem is reconciled with donor manifest: only files whose
+        digests differ are transferred, and files and directories that
+        donor does not have are removed. Empty filesystem, or one that
+        could not be reconciled, is replaced with donor snapshot in
+        single request instead, which resets working directory.
+
         Parameters
         ----------
         donor_url : str
             URL to access donor node.
         """
-        with urlopen(urljoin(donor_url, '/snap')) as resp:
-            unpack(resp.read(), self._fs_root)
+        try:
+            with self._http.open(urljoin(donor_url, '/manifest')) as resp:
+                remote = parse_manifest(resp.read())
+            local = dict(manifest(self._fs_root))
+            if local:
+                self._sync_changed(donor_url, remote, local)
+                return
+        except (OSError, ValueError, CommandError):
+            pass
+        self.mkfs()
+        with self._http.open(urljoin(donor_url, '/snap')) as resp:
+            unpack(resp, self._fs_root)
+
+    def _sync_changed(
+        self,
+        donor_url: str,
+        remote: List[Tuple[str, str]],
+        local: Dict[str, str],
+    ):
+        kept = {path for (path, _) in remote}
+        for path in sorted(local.keys() - kept, reverse=True):
+            fs_path = self._fs_root + path
+            if local[path]:
+                os.remove(fs_path)
+            else:
+                shutil.rmtree(fs_path)
+        cat_url = urljoin(donor_url, '/cat')
+        for path, digest in remote:
+            have = local.get(path)
+            if have == digest:
+                continue
+            fs_path = self._fs_root + path
+            if not digest:
+                if have is not None:
+                    os.remove(fs_path)
+                os.mkdir(fs_path)
+                continue
+            if have == '':
+                shutil.rmtree(fs_path)
+            with self._http.open(cat_url, data=path.encode('utf-8')) as resp:
+                write_file(fs_path, resp)
+
+    def bootstrap(self, donor_url: str) -> Tuple[str, int, int]:
+        """
+        Synchronize filesystem with donor data node and change working
+        directory to the one of donor, in single request. If working
+        directory of donor does not exist, root directory is used.
+
+        Parameters
+        ----------
+        donor_url : str
+            URL to access donor node.
 
-    def snap(self) -> bytes:
+        Returns
+        -------
+        Tuple[str, int, int]:
+            Full path, size in bytes and mode of new working directory.
+        """
+        self.sync(donor_url)
+        try:
+            workdir = self._http.request(
+                urljoin(donor_url, '/stat'),
+                data=b'.',
+                deserialize=deserialize_stat,
+            )[0]
+            self.cd(workdir)
+        except CommandError:
+            self.cd('/')
+        return self.stat('.')
+
+    def manifest(self) -> List[Tuple[str, str]]:
+        """
+        List directories and files of filesystem with digests of file
+        contents, so that peers can fetch only changed files.
+
+        Returns
+        -------
+        List[Tuple[str, str]]:
+            Sorted array of absolute paths and SHA-256 digests. Digest
+            of directory is empty string.
+        """
+        return manifest(self._fs_root)
+
+    def snap(self) -> BinaryIO:
         """
         Create filesystem snapshot.
 
+        Snapshot is spooled to anonymous temporary file next to
+        filesystem root instead of memory, so that it can be sent
+        without buffering it whole.
+
         Returns
         -------
-        bytes:
-            gzip compressed tarball of filesystem
+        BinaryIO:
+            Open file with gzip compressed tarball of filesystem,
+            positioned at start.
         """
-        return package(self._fs_root)
+        snapshot = tempfile.TemporaryFile(
+            dir=os.path.dirname(self._fs_root) or '.',
+        )
+        try:
+            package(self._fs_root, snapshot)
+            snapshot.seek(0)
+        except BaseException:
+            snapshot.close()
+            raise
+        return snapshot
 
     def ping_alive(self) -> True:
         """
@@ -372,29 +861,31 @@ class DataNode:
                 'Can only join one namespace. '
                 f'Please leave {self._namenode_url} first'
             )
-        if not urlparse(namenode_url).netloc:
+        if not urlsplit(namenode_url).netloc:
             raise CommandError(f'Invalid namenode url {namenode_url}')
         data = self._advertise_port + ' ' + self._id
         if self._advertise_host:
             data = self._advertise_host + ':' + data
         if self._public_url:
             data = self._public_url + ' ' + data
-        urlopen(
+        with self._http.open(
             urljoin(namenode_url, '/nodes/join'),
             data=data.encode('utf-8'),
-        ).close()
+        ):
+            pass
         self._namenode_url = namenode_url
 
     def leave_namespace(self):
         """
         Exit cluster.
         """
-        if self._namenode_url:
+        if not self._namenode_url:
             raise CommandError('Not a member of namespace')
         try:
-            urlopen(
+            with self._http.open(
                 urljoin(self._namenode_url, '/nodes/leave')
-            ).close()
+            ):
+                pass
         except (URLError, HTTPError):
             print(
                 "Failed to notify namenode. Still leaving!",
@@ -407,18 +898,23 @@ class DataNode:
         '/df': (df, deserialize, serialize),
         '/cd': (cd, deserialize, serialize),
         '/ls': (ls, deserialize, serialize),
+        '/ls_stat': (ls_stat, deserialize, serialize_matrix),
         '/mkdir': (mkdir, deserialize, serialize),
         '/rmdir': (rmdir, deserialize, serialize),
         '/touch': (touch, deserialize, serialize),
-        '/cat': (cat, deserialize, serialize),
-        '/tee': (tee, deserialize, serialize),
+        '/cat': (cat_stream, deserialize_path, serialize_file),
+        '/cat_range': (cat_range, deserialize_range, serialize),
+        '/tee': (tee, deserialize_stream, serialize),
         '/rm': (rm, deserialize, serialize),
         '/stat': (stat, deserialize, serialize),
+        '/stat_batch': (stat_batch, deserialize_paths, serialize_matrix),
         '/cp': (cp, deserialize, serialize),
         '/mv': (mv, deserialize, serialize),
 
         '/sync': (sync, deserialize, serialize),
-        '/snap': (snap, deserialize, serialize),
+        '/bootstrap': (bootstrap, deserialize, serialize),
+        '/manifest': (manifest, deserialize, serialize_manifest),
+        '/snap': (snap, deserialize, serialize_file),
         '/ping_alive': (ping_alive, deserialize, serialize),
 
         '/join_namespace': (join_namespace, deserialize, serialize),
@@ -1,6 +1,18 @@
 #!/usr/bin/env python3
-from errno import ENOENT
+import os
+import time
+import itertools
+from errno import (
+    ENOENT,
+    EEXIST,
+    EISDIR,
+    ENOTDIR,
+    ENOTEMPTY,
+    EBUSY,
+    EIO,
+)
 from stat import S_IFDIR
+from urllib.error import URLError, HTTPError
 try:
     from fuse import FUSE, FuseOSError, Operations
 except ImportError:
@@ -24,89 +36,222 @@ except ImportError:
         sys.exit(code)
     os.execv(sys.argv[0], sys.argv)
 
+from util import CommandError
 from http_name_node import HttpNameNode
 
 
+_ERRNOS = {
+    'does not exist': ENOENT,
+    'already exists': EEXIST,
+    'is a directory': EISDIR,
+    'is not a dir': ENOTDIR,
+    'is not empty': ENOTEMPTY,
+    'Cannot remove root dir': EBUSY,
+}
+
+
+def _errno(error):
+    message = str(error)
+    for suffix, code in _ERRNOS.items():
+        if message.endswith(suffix):
+            return code
+    return ENOENT
+
+
+def _parent(path):
+    return path.rsplit('/', 1)[0] or '/'
+
+
 class DFS(Operations):
 
+    CACHE_TTL = 1.0
+    CACHE_SIZE = 20000
+    READ_AHEAD = 1024 * 1024
+    RETRY_DELAY = 0.05
+
     def __init__(self, url, mkfs=False):
         self._node = HttpNameNode(url)
+        self._attr_cache = {}
+        self._dir_cache = {}
+        self._write_buffers = {}
+        self._read_cache = {}
+        self._handles = itertools.count(1)
         if not self._node.ping_alive():
-            raise Exception('Cannot connect to cluster')
+            raise CommandError('Cannot connect to cluster')
         if mkfs:
             self._node.mkfs()
 
-    def create(self, path, mode):
+    def _call(self, method, *args, retry=False):
         try:
-            self._node.touch(path)
-            return 0
-        except:
+            try:
+                return method(*args)
+            except HTTPError:
+                raise
+            except URLError:
+                if not retry:
+                    raise
+                time.sleep(self.RETRY_DELAY)
+                return method(*args)
+        except CommandError as e:
+            raise FuseOSError(_errno(e))
+        except HTTPError as e:
+            raise FuseOSError(ENOENT if e.code == 404 else EIO)
+        except OSError:
+            raise FuseOSError(EIO)
+
+    def _cached(self, cache, method, path):
+        now = time.monotonic()
+        hit = cache.get(path)
+        if hit and now - hit[0] < self.CACHE_TTL:
+            value = hit[1]
+        else:
+            try:
+                value = self._call(method, path, retry=True)
+            except FuseOSError as e:
+                if e.errno != ENOENT:
+                    raise
+                value = None
+            if len(cache) >= self.CACHE_SIZE:
+                cache.clear()
+            cache[path] = (now, value)
+        if value is None:
             raise FuseOSError(ENOENT)
+        return value
+
+    def _invalidate(self, *paths):
+        for path in paths:
+            for key in (path, _parent(path)):
+                self._attr_cache.pop(key, None)
+                self._dir_cache.pop(key, None)
+
+    def create(self, path, mode):
+        self._invalidate(path)
+        self._call(self._node.touch, path)
+        self._write_buffers[path] = bytearray()
+        return next(self._handles)
+
+    def open(self, path, flags):
+        if flags & os.O_TRUNC:
+            self._write_buffers[path] = bytearray()
+        return next(self._handles)
 
     def getattr(self, path, fh=None):
-        try:
-            st = self._node.stat(path)
-            return {
-                'st_size': st[1],
-                'st_mode': st[2],
-                'st_nlink': 1,
-            }
-        except:
-            raise FuseOSError(ENOENT)
+        st = self._cached(self._attr_cache, self._node.stat, path)
+        buf = self._write_buffers.get(path)
+        return {
+            'st_size': st[1] if buf is None else len(buf),
+            'st_mode': st[2],
+            'st_nlink': 1,
+        }
 
     getxattr = None
 
     def truncate(self, path, length, fh=None):
-        pass
+        buf = self._buffer(path, load=length > 0)
+        del buf[length:]
+        buf.extend(bytes(length - len(buf)))
+        if fh is None:
+            self._flush(path)
 
     def mkdir(self, path, mode):
-        try:
-            self._node.mkdir(path)
-        except:
-            raise FuseOSError(ENOENT)
+        self._invalidate(path)
+        self._call(self._node.mkdir, path)
 
     def read(self, path, size, offset, fh):
-        try:
-            return self._node.cat(path)
-        except:
-            raise FuseOSError(ENOENT)
+        buf = self._write_buffers.get(path)
+        if buf is not None:
+            return bytes(buf[offset:offset + size])
+        hit = self._read_cache.get(fh)
+        if (
+            hit is None
+            or hit[0] != path
+            or not hit[1] <= offset <= hit[1] + len(hit[2])
+            or offset + size > hit[1] + len(hit[2]) and not hit[3]
+        ):
+            length = max(size, self.READ_AHEAD)
+            data = self._call(
+                self._node.cat_range,
+                path,
+                offset,
+                length,
+                retry=True,
+            )
+            hit = (path, offset, data, len(data) < length)
+            self._read_cache[fh] = hit
+        start = offset - hit[1]
+        return hit[2][start:start + size]
+
+    def _ls(self, path):
+        entries = self._node.ls_stat(path)
+        if len(self._attr_cache) + len(entries) > self.CACHE_SIZE:
+            self._attr_cache.clear()
+        now = time.monotonic()
+        prefix = path.rstrip('/') + '/'
+        for name, size, mode in entries:
+            child = prefix + name
+            self._attr_cache[child] = (now, (child, size, mode))
+        return [name for name, _, _ in entries]
 
     def readdir(self, path, fh):
-        try:
-            return self._node.ls(path)
-        except:
-            raise FuseOSError(ENOENT)
+        return self._cached(self._dir_cache, self._ls, path)
 
     def readlink(self, path):
-        try:
-            return self._node.stat(path)[0]
-        except:
-            raise FuseOSError(ENOENT)
+        return self._cached(self._attr_cache, self._node.stat, path)[0]
 
     def rename(self, old, new):
-        try:
-            self._node.mv(old, new)
-        except:
-            raise FuseOSError(ENOENT)
+        self._flush(old)
+        self._attr_cache.clear()
+        self._dir_cache.clear()
+        self._call(self._node.mv, old, new)
 
     def rmdir(self, path):
-        try:
-            self._node.rmdir(path)
-        except:
-            raise FuseOSError(ENOENT)
+        self._invalidate(path)
+        self._call(self._node.rmdir, path)
 
     def unlink(self, path):
-        try:
-            self._node.rm(path)
-        except:
-            raise FuseOSError(ENOENT)
+        self._write_buffers.pop(path, None)
+        self._invalidate(path)
+        self._call(self._node.rm, path)
+
+    def _buffer(self, path, load=True):
+        buf = self._write_buffers.get(path)
+        if buf is None:
+            buf = bytearray(
+                self._call(self._node.cat, path, retry=True)
+                if load else b''
+            )
+            self._write_buffers[path] = buf
+        return buf
 
     def write(self, path, data, offset, fh):
-        try:
-            self._node.tee(path, data)
-            return len(data)
-        except:
-            raise FuseOSError(ENOENT)
+        buf = self._buffer(path)
+        if offset > len(buf):
+            buf.extend(bytes(offset - len(buf)))
+        buf[offset:offset + len(data)] = data
+        return len(data)
+
+    def _flush(self, path):
+        buf = self._write_buffers.get(path)
+        if buf is not None:
+            self._invalidate(path)
+            for fh, hit in list(self._read_cache.items()):
+                if hit[0] == path:
+                    del self._read_cache[fh]
+            self._call(self._node.tee, path, buf)
+            del self._write_buffers[path]
+
+    def flush(self, path, fh):
+        self._flush(path)
+        return 0
+
+    def fsync(self, path, datasync, fh):
+        self._flush(path)
+        return 0
+
+    def release(self, path, fh):
+        self._read_cache.pop(fh, None)
+        self._flush(path)
+        return 0
 
 
 if __name__ == '__main__':
@@ -1,6 +1,6 @@
-from typing import Optional, List, Tuple
-from urllib.request import urlopen, HTTPError, URLError
-from urllib.parse import urlparse, urljoin
+from typing import Optional, List, Tuple, Union, BinaryIO
+from urllib.request import HTTPError, URLError
+from urllib.parse import urlparse
 
 from util import *
 
@@ -10,9 +10,29 @@ class HttpDataNode:
     Python API for interaction with remote DataNode server through HTTP.
     It implements same api as DataNode, but delegates actual execution
     to remote data node server through HTTP.
+
+    Requests are sent through connection pool shared between clients,
+    and errors reported by server are raised as CommandError.
+
+    Class Attributes
+    ----------------
+    BOOTSTRAP_TIMEOUT : float
+        Socket timeout of bootstrap request, as data node answers it
+        only after copying whole filesystem from donor.
+    _ENDPOINTS : Tuple[str, ...]
+        Names of endpoints, whose URLs are built once per node.
     """
 
-    def __init__(self, url: str):
+    BOOTSTRAP_TIMEOUT = 600.0
+
+    _ENDPOINTS = (
+        'mkfs', 'df', 'cd', 'ls', 'ls_stat', 'mkdir', 'rmdir', 'touch', 'cat',
+        'cat_range', 'tee', 'rm', 'stat', 'stat_batch', 'cp', 'mv', 'sync',
+        'bootstrap', 'snap', 'ping_alive', 'join_namespace',
+        'leave_namespace',
+    )
+
+    def __init__(self, url: str, pool: Optional[ConnectionPool] = None):
         """
         Set data node server url.
 
@@ -20,127 +40,150 @@ class HttpDataNode:
         ----------
         url : str
             URL to data node server.
+        pool : Optional[ConnectionPool]
+            Pool to send requests through. If not specified pool
+            shared between clients is used.
         """
         if not urlparse(url).netloc:
             raise CommandError(f'Invalid node url {url}')
         self._url = url
+        self._ep = endpoints(url, self._ENDPOINTS)
+        self._pool = pool or http_pool
 
     def mkfs(self):
-        urlopen(urljoin(self._url, '/mkfs')).close()
+        self._pool.request(self._ep['mkfs'])
 
     def df(self) -> Tuple[int, int, int]:
-        with urlopen(urljoin(self._url, '/df')) as resp:
-            return deserialize_tuple(
-                resp,
-                resp.length,
-                urlparse(resp.url).hostname,
-            )
+        return self._pool.request(
+            self._ep['df'],
+            deserialize=deserialize_tuple,
+        )
 
     def cd(self, path: str):
-        urlopen(
-            urljoin(self._url, '/cd'),
+        self._pool.request(
+            self._ep['cd'],
             data=path.encode('utf-8'),
-        ).close()
+        )
 
     def ls(self, path: Optional[str] = None) -> List[str]:
-        with urlopen(
-            urljoin(self._url, '/ls'),
+        return self._pool.request(
+            self._ep['ls'],
+            data=path.encode('utf-8') if path else b'',
+            deserialize=deserialize_list,
+        )
+
+    def ls_stat(
+        self,
+        path: Optional[str] = None,
+    ) -> List[Tuple[str, int, int]]:
+        return self._pool.request(
+            self._ep['ls_stat'],
             data=path.encode('utf-8') if path else b'',
-        ) as resp:
-            return deserialize_list(
-                resp,
-                resp.length,
-                urlparse(resp.url).hostname,
-            )
+            deserialize=deserialize_entries,
+        )
 
     def mkdir(self, path: str):
-        urlopen(
-            urljoin(self._url, '/mkdir'),
+        self._pool.request(
+            self._ep['mkdir'],
             data=path.encode('utf-8'),
-        ).close()
+        )
 
     def rmdir(self, path: str, force: Optional[bool] = False):
-        data = path + ('!' if force else '')
-        urlopen(
-            urljoin(self._url, '/rmdir'),
+        data = path + (' !' if force else '')
+        self._pool.request(
+            self._ep['rmdir'],
             data=data.encode('utf-8'),
-        ).close()
+        )
 
     def touch(self, path: str):
-        urlopen(
-            urljoin(self._url, '/touch'),
+        self._pool.request(
+            self._ep['touch'],
             data=path.encode('utf-8'),
-        ).close()
+        )
 
     def cat(self, path: str) -> bytes:
-        with urlopen(
-            urljoin(self._url, '/cat'),
+        return self._pool.request(
+            self._ep['cat'],
             data=path.encode('utf-8'),
-        ) as resp:
-            return resp.read()
+        )
+
+    def cat_range(self, path: str, offset: int, size: int) -> bytes:
+        data = f'{offset} {size} {path}'
+        return self._pool.request(
+            self._ep['cat_range'],
+            data=data.encode('utf-8'),
+        )
 
-    def tee(self, path: str, data: bytes):
-        data = path.encode('utf-8') + b'\0' + data
-        urlopen(
-            urljoin(self._url, '/tee'),
+    def tee(self, path: str, data: Union[bytes, BinaryIO]):
+        data = (path.encode('utf-8') + b'\0', data)
+        self._pool.request(
+            self._ep['tee'],
             data=data,
-        ).close()
+        )
 
     def rm(self, path: str):
-        urlopen(
-            urljoin(self._url, '/rm'),
+        self._pool.request(
+            self._ep['rm'],
             data=path.encode('utf-8'),
-        ).close()
+        )
 
     def stat(self, path: str) -> Tuple[str, int, int]:
-        with urlopen(
-            urljoin(self._url, '/stat'),
+        return self._pool.request(
+            self._ep['stat'],
             data=path.encode('utf-8'),
-        ) as resp:
-            return deserialize_stat(
-                resp,
-                resp.length,
-                urlparse(resp.url).hostname,
-            )
+            deserialize=deserialize_stat,
+        )
+
+    def stat_batch(self, paths: List[str]) -> List[Tuple[str, str, int, int]]:
+        return self._pool.request(
+            self._ep['stat_batch'],
+            data='\n'.join(paths).encode('utf-8'),
+            deserialize=deserialize_stat_batch,
+        )
 
     def cp(self, src: str, dst: str):
         data = src + ' ' + dst
-        urlopen(
-            urljoin(self._url, '/cp'),
+        self._pool.request(
+            self._ep['cp'],
             data=data.encode('utf-8'),
-        ).close()
+        )
 
     def mv(self, src: str, dst: str):
         data = src + ' ' + dst
-        urlopen(
-            urljoin(self._url, '/mv'),
+        self._pool.request(
+            self._ep['mv'],
             data=data.encode('utf-8'),
-
-        ).close()
+        )
 
     def sync(self, donor_url: str):
-        urlopen(
-            urljoin(self._url, '/sync'),
+        self._pool.request(
+            self._ep['sync'],
             data=donor_url.encode('utf-8'),
-        ).close()
+        )
+
+    def bootstrap(self, donor_url: str) -> Tuple[str, int, int]:
+        return self._pool.request(
+            self._ep['bootstrap'],
+            data=donor_url.encode('utf-8'),
+            deserialize=deserialize_stat,
+            timeout=self.BOOTSTRAP_TIMEOUT,
+        )
 
     def snap(self) -> bytes:
-        with urlopen(urljoin(self._url, '/snap')) as resp:
-            return resp.read()
+        return self._pool.request(self._ep['snap'])
 
     def ping_alive(self) -> bool:
         try:
-            urlopen(urljoin(self._url, '/ping_alive')).close()
+            self._pool.request(self._ep['ping_alive'])
             return True
         except (HTTPError, URLError):
             return False
 
     def join_namespace(self, namenode_url: str):
-        urlopen(
-            urljoin(self._url, '/join_namespace'),
+        self._pool.request(
+            self._ep['join_namespace'],
             data=namenode_url.encode('utf-8'),
-        ).close()
+        )
 
     def leave_namespace(self):
-        urlopen(urljoin(self._url, '/leave_namespace')).close()
-
+        self._pool.request(self._ep['leave_namespace'])
@@ -1,6 +1,7 @@
-from typing import Optional, List, Tuple
-from urllib.request import urlopen, HTTPError, URLError
-from urllib.parse import urlparse, urljoin
+import time
+from typing import Optional, List, Tuple, Callable, Any
+from urllib.request import HTTPError, URLError
+from urllib.parse import urlparse
 
 from util import *
 
@@ -10,8 +11,26 @@ class HttpNameNode:
     Python API for client of remote DFS cluster. It implements
     same API as NameNode, but delegates actual execution to remote
     name node server instance.
+
+    Requests are sent through connection pool shared between clients,
+    and errors reported by server are raised as CommandError.
+
+    Class Attributes
+    ----------------
+    REDIRECT_TTL : float
+        Seconds for which data node selected by name node for read
+        operations is reused without asking name node again.
+    _ENDPOINTS : Tuple[str, ...]
+        Names of endpoints, whose URLs are built once per node.
     """
 
+    REDIRECT_TTL = 5.0
+    _ENDPOINTS = (
+        'add_node', 'status', 'mkfs', 'df', 'cd', 'mkdir', 'rmdir', 'touch',
+        'tee', 'rm', 'cp', 'mv', 'ping_alive', 'ls', 'ls_stat', 'cat',
+        'cat_range', 'stat',
+    )
+
     def __init__(self, url: str):
         """
         Set name node server url.
@@ -24,136 +43,135 @@ class HttpNameNode:
         if not urlparse(url).netloc:
             raise CommandError(f'Invalid node url {url}')
         self._url = url
+        self._ep = endpoints(url, self._ENDPOINTS)
+        self._pool = http_pool
+        self._redirects = {}
+
+    def _read(
+        self,
+        endpoint: str,
+        data: bytes,
+        deserialize: Optional[Callable] = None,
+    ) -> Any:
+        """
+        Run read operation on data node selected by name node.
+
+        Selected data node URL is cached for REDIRECT_TTL seconds, so
+        that consecutive reads take one round trip. If cached data
+        node can not be reached, name node is asked again.
+        """
+        now = time.monotonic()
+        hit = self._redirects.get(endpoint)
+        if hit and now - hit[0] < self.REDIRECT_TTL:
+            try:
+                return self._pool.request(hit[1], data, deserialize)
+            except URLError:
+                del self._redirects[endpoint]
+        url = self._pool.request(
+            self._ep[endpoint],
+            data=data,
+        ).decode('utf-8')
+        self._redirects[endpoint] = (now, url)
+        return self._pool.request(url, data, deserialize)
 
     def add_node(self, public_url: str, url: str, node_id: str):
         data = url + ' ' + node_id
-        urlopen(
-            urljoin(self._url, '/add_node'),
+        self._pool.request(
+            self._ep['add_node'],
             data=data.encode('utf-8'),
-        ).close()
+        )
 
     def status(self) -> List[Tuple[str, int]]:
-        with urlopen(urljoin(self._url, '/status')) as resp:
-            return deserialize_matrix(
-                resp,
-                resp.length,
-                urlparse(resp.url).hostname,
-            )
+        return self._pool.request(
+            self._ep['status'],
+            deserialize=deserialize_matrix,
+        )
 
     def mkfs(self):
-        urlopen(urljoin(self._url, '/mkfs')).close()
+        self._pool.request(self._ep['mkfs'])
 
     def df(self) -> List[Tuple[str, int, int, int]]:
-        with urlopen(urljoin(self._url, '/df')) as resp:
-            return deserialize_matrix(
-                resp,
-                resp.length,
-                urlparse(resp.url).hostname,
-            )
+        return self._pool.request(
+            self._ep['df'],
+            deserialize=deserialize_matrix,
+        )
 
     def cd(self, path: str):
-        urlopen(
-            urljoin(self._url, '/cd'),
+        self._pool.request(
+            self._ep['cd'],
             data=path.encode('utf-8'),
-        ).close()
+        )
 
     def ls(self, path: Optional[str] = None) -> list:
         data = path.encode('utf-8') if path else b''
-        with urlopen(
-            urljoin(self._url, '/ls'),
-            data=data,
-        ) as resp:
-            url = resp.read().decode('utf-8')
-        with urlopen(
-            url,
-            data=data,
-        ) as resp:
-            return deserialize_list(
-                resp,
-                resp.length,
-                urlparse(resp.url).hostname,
-            )
+        return self._read('ls', data, deserialize_list)
+
+    def ls_stat(
+        self,
+        path: Optional[str] = None,
+    ) -> List[Tuple[str, int, int]]:
+        data = path.encode('utf-8') if path else b''
+        return self._read('ls_stat', data, deserialize_entries)
 
     def mkdir(self, path: str):
-        urlopen(
-            urljoin(self._url, '/mkdir'),
+        self._pool.request(
+            self._ep['mkdir'],
             data=path.encode('utf-8'),
-        ).close()
+        )
 
     def rmdir(self, path: str, force: Optional[bool] = False):
-        data = path + ('!' if force else '')
-        urlopen(
-            urljoin(self._url, '/rmdir'),
+        data = path + (' !' if force else '')
+        self._pool.request(
+            self._ep['rmdir'],
             data=data.encode('utf-8'),
-        ).close()
+        )
 
     def touch(self, path: str):
-        urlopen(
-            urljoin(self._url, '/touch'),
+        self._pool.request(
+            self._ep['touch'],
             data=path.encode('utf-8'),
-        ).close()
+        )
 
     def cat(self, path: str) -> bytes:
-        data = path.encode('utf-8')
-        with urlopen(
-            urljoin(self._url, '/cat'),
-            data=data,
-        ) as resp:
-            url = resp.read().decode('utf-8')
-        with urlopen(
-            url,
-            data=data,
-        ) as resp:
-            return resp.read()
+        return self._read('cat', path.encode('utf-8'))
+
+    def cat_range(self, path: str, offset: int, size: int) -> bytes:
+        data = f'{offset} {size} {path}'
+        return self._read('cat_range', data.encode('utf-8'))
 
     def tee(self, path: str, data: bytes):
-        data = path.encode('utf-8') + b'\0' + data
-        urlopen(
-            urljoin(self._url, '/tee'),
+        data = (path.encode('utf-8') + b'\0', data)
+        self._pool.request(
+            self._ep['tee'],
             data=data,
-        ).close()
+        )
 
     def rm(self, path: str):
-        urlopen(
-            urljoin(self._url, '/rm'),
+        self._pool.request(
+            self._ep['rm'],
             data=path.encode('utf-8'),
-        ).close()
+        )
 
     def stat(self, path: str) -> tuple:
-        data = path.encode('utf-8')
-        with urlopen(
-            urljoin(self._url, '/stat'),
-            data=data,
-        ) as resp:
-            url = resp.read().decode('utf-8')
-        with urlopen(
-            url,
-            data=data,
-        ) as resp:
-            return deserialize_stat(
-                resp,
-                resp.length,
-                urlparse(resp.url).hostname,
-            )
+        return self._read('stat', path.encode('utf-8'), deserialize_stat)
 
     def cp(self, src: str, dst: str):
         data = src + ' ' + dst
-        urlopen(
-            urljoin(self._url, '/cp'),
+        self._pool.request(
+            self._ep['cp'],
             data=data.encode('utf-8'),
-        ).close()
+        )
 
     def mv(self, src: str, dst: str):
         data = src + ' ' + dst
-        urlopen(
-            urljoin(self._url, '/mv'),
+        self._pool.request(
+            self._ep['mv'],
             data=data.encode('utf-8'),
-        ).close()
+        )
 
     def ping_alive(self) -> bool:
         try:
-            urlopen(urljoin(self._url, '/ping_alive')).close()
+            self._pool.request(self._ep['ping_alive'])
             return True
         except (HTTPError, URLError):
             return False
-
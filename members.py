@@ -10,12 +10,13 @@ ALIVE : str
 DEAD : str
     'dead' - status of dead nodes
 """
-import csv
+import os
 import time
-from typing import Dict, List
-from threading import RLock
+import random
+from operator import itemgetter
+from typing import Dict, List, Tuple, Iterable
+from threading import Lock, Timer
 from pathlib import Path
-from contextlib import contextmanager
 
 
 def current_time() -> str:
@@ -30,6 +31,13 @@ def current_time() -> str:
     return time.strftime('%Y-%m-%d %H:%M:%S')
 
 
+def _private_opener(path: str, flags: int) -> int:
+    return os.open(path, flags, 0o600)
+
+
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+
 NEW = 'new'
 ALIVE = 'alive'
 DEAD = 'dead'
@@ -39,9 +47,12 @@ class Member:
     """
     Data node info. Should be created through MemberDB methods.
     It allows transparent thread-safe database modification through
-    python properties that aquire database lock on write.
+    python properties that save changes to database on write, or
+    through update to change several fields at once.
     """
 
+    __slots__ = ('_id', '_url', '_public_url', '_status', '_db')
+
     def __init__(
         self,
         id: str,
@@ -65,15 +76,29 @@ class Member:
         }
         self._db.update(record)
 
+    def update(self, **fields):
+        """
+        Change several fields at once, saving them to database with
+        single update. Preferred over setting properties one by one.
+
+        Parameters
+        ----------
+        fields : dict
+            New values of id, url, public_url or status.
+        """
+        for (key, value) in fields.items():
+            if key not in MemberDB._FIELDS:
+                raise TypeError(f'Unknown member field {key}')
+            setattr(self, '_' + key, value)
+        self.save()
+
     @property
     def id(self):
         return self._id
 
     @id.setter
     def id(self, v):
-        with self._db._lock:
-            self._id = v
-            self.save()
+        self.update(id=v)
 
     @property
     def url(self):
@@ -81,9 +106,7 @@ class Member:
 
     @url.setter
     def url(self, v):
-        with self._db._lock:
-            self._url = v
-            self.save()
+        self.update(url=v)
 
     @property
     def public_url(self):
@@ -91,9 +114,7 @@ class Member:
 
     @public_url.setter
     def public_url(self, v):
-        with self._db._lock:
-            self._public_url = v
-            self.save()
+        self.update(public_url=v)
 
     @property
     def status(self):
@@ -101,9 +122,7 @@ class Member:
 
     @status.setter
     def status(self, v):
-        with self._db._lock:
-            self._status = v
-            self.save()
+        self.update(status=v)
 
 
 class MemberDB:
@@ -114,16 +133,41 @@ class MemberDB:
     writing through them while keeping, records in sync in memory
     and on disk.
 
+    Records are indexed by status, so that filtering by status does not
+    scan all members.
+
+    Changes are appended to database file as journal of records,
+    where last record with given id wins. File is kept open for
+    appending until close. It is compacted to one record per member
+    once journal grows long. Writes are delayed
+    by FLUSH_DELAY, so that burst of changes is written at once.
+    Call flush to write pending changes immediately.
+
+    Status of members is soft state restored by heartbeat, so its
+    changes are not synced to disk. New members and changes of their
+    URLs are written and synced with fdatasync right away, as well as
+    compacted file.
+
     Class Attrubutes
     ----------------
-    _DIALECT : str
-        Dialect used for csv formatting
+    COMPACT_EVERY : int
+        Number of journal records appended beyond one per member,
+        after which database file is rewritten.
+    FLUSH_DELAY : float
+        Seconds from first unsaved change to its write to disk.
+    _DURABLE_FIELDS : Tuple[str, ...]
+        Fields, changes of which are synced to disk.
     _FIELDS : List[str]
-        List of fields used by csv.DictReader and csv.DictWriter
+        List of fields in order of tab separated columns
+    _ROW : Callable
+        Routine to extract columns from record
     """
 
-    _DIALECT = 'excel-tab'
+    COMPACT_EVERY = 256
+    FLUSH_DELAY = 0.02
+    _DURABLE_FIELDS = ('url', 'public_url')
     _FIELDS = ['id', 'url', 'public_url', 'status']
+    _ROW = itemgetter(*_FIELDS)
 
     def __init__(self, path: str):
         """
@@ -134,19 +178,118 @@ class MemberDB:
         path : str
             Path to database file.
         """
-        path = Path(path)
-        path.touch(mode=0o600)
-        self._path = path
-        self._lock = RLock()
-        with self._lock, self._open_read() as records:
-            self._records = { r['id']: r for r in records }
+        self._path = Path(path)
+        self._lock = Lock()
+        self._journal_len = 0
+        self._dirty = set()
+        self._durable = False
+        self._flush_timer = None
+        self._fd = None
+        self._records = {}
+        with self._lock:
+            try:
+                with open(self._path, newline='', encoding='utf-8') as fs:
+                    for line in fs:
+                        row = line.rstrip('\r\n').split('\t')
+                        if len(row) != len(self._FIELDS):
+                            continue
+                        r = dict(zip(self._FIELDS, row))
+                        self._records[r['id']] = r
+                        self._journal_len += 1
+            except FileNotFoundError:
+                pass
+            self._by_status = {}
+            for id, r in self._records.items():
+                self._by_status.setdefault(r['status'], {})[id] = None
 
     def sync(self):
         """
-        Synchronize records to disk.
+        Synchronize records to disk, rewriting database file with
+        single record per member.
+        """
+        with self._lock:
+            self._sync()
+
+    def flush(self):
+        """
+        Write pending changes to disk.
         """
-        with self._lock, self._open_write() as writer:
-            writer.writerows(self._records.values())
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """
+        Write pending changes to disk and close database file.
+        """
+        with self._lock:
+            self._flush()
+            self._close()
+
+    def __del__(self):
+        if getattr(self, '_fd', None) is not None:
+            os.close(self._fd)
+
+    # Methods below expect database lock to be held by caller.
+
+    def _sync(self):
+        tmp_path = self._path.with_name(self._path.name + '.tmp')
+        self._cancel_flush()
+        self._dirty.clear()
+        data = self._format(self._records.values()).encode('utf-8')
+        with open(tmp_path, 'wb', opener=_private_opener) as fs:
+            fs.write(data)
+            fs.flush()
+            _fdatasync(fs.fileno())
+        os.replace(tmp_path, self._path)
+        self._durable = False
+        self._close()
+        self._journal_len = len(self._records)
+
+    def _flush(self):
+        self._cancel_flush()
+        if not self._dirty:
+            return
+        records = [self._records[id] for id in self._dirty]
+        self._dirty.clear()
+        self._append(records)
+        self._journal_len += len(records)
+        if self._journal_len >= len(self._records) + self.COMPACT_EVERY:
+            self._sync()
+        elif self._durable:
+            _fdatasync(self._fd)
+            self._durable = False
+
+    def _reindex(self, id: str, old_status: str, status: str):
+        if old_status == status:
+            return
+        if old_status is not None:
+            del self._by_status[old_status][id]
+        self._by_status.setdefault(status, {})[id] = None
+
+    def _cancel_flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def _mark_dirty(self, id: str):
+        self._dirty.add(id)
+        if self._flush_timer is None:
+            self._flush_timer = Timer(self.FLUSH_DELAY, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _update(self, record: Dict[str, str]):
+        id = record['id']
+        old = self._records[id]
+        for field in self._DURABLE_FIELDS:
+            if field in record and record[field] != old[field]:
+                self._durable = True
+        old_status = old['status']
+        old.update(record)
+        self._reindex(id, old_status, old['status'])
+        self._mark_dirty(id)
+        if self._durable:
+            self._flush()
 
     def get(self, id: str) -> Member:
         """
@@ -174,8 +317,23 @@ class MemberDB:
             Record instance to rewrite.
         """
         with self._lock:
-            self._records[record['id']].update(record)
-            self.sync()
+            self._update(record)
+
+    def update_many(self, records: List[Dict[str, str]]):
+        """
+        Update several records at once.
+
+        Parameters
+        ----------
+        records : List[Dict]
+            Record instances to rewrite. Each of them has to contain
+            id and may contain only some of other fields.
+        """
+        if not records:
+            return
+        with self._lock:
+            for record in records:
+                self._update(record)
 
     def create(
         self,
@@ -207,11 +365,15 @@ class MemberDB:
             record = {
                 'id': id,
                 'url': url,
-                'public_url': public_url,
+                'public_url': public_url or '',
                 'status': status,
             }
+            old = self._records.get(id)
             self._records[id] = record
-            self.sync()
+            self._reindex(id, old and old['status'], status)
+            self._mark_dirty(id)
+            self._durable = True
+            self._flush()
             return Member(**record, database=self)
 
     def filter(self, **kwargs) -> List[Member]:
@@ -232,31 +394,88 @@ class MemberDB:
             if filters are not given.
         """
         with self._lock:
+            return [Member(**r, database=self) for r in self._match(kwargs)]
+
+    def filter_records(self, **kwargs) -> List[Dict[str, str]]:
+        """
+        Find records that match the filters in kwargs, for read-only
+        access.
+
+        Same as filter, but returns copies of records instead of
+        Member instances, which is cheaper when members are not
+        modified.
+
+        Parameters
+        ----------
+        kwargs : dict
+            Attributes to filter records by
+
+        Returns
+        -------
+        List[Dict[str, str]]:
+            List of records matching filters. Or all records if
+            filters are not given.
+        """
+        with self._lock:
+            return [dict(r) for r in self._match(kwargs)]
+
+    def _match(self, filters: Dict[str, str]) -> List[Dict[str, str]]:
+        if 'status' in filters:
+            ids = self._by_status.get(filters.pop('status'), ())
+            records = [self._records[id] for id in ids]
+        else:
+            records = list(self._records.values())
+        for (key, value) in filters.items():
             records = [
-                r for r in self._records.values()
+                r for r in records
+                if r[key] == value
             ]
-            for (key, value) in kwargs.items():
-                records = [
-                    r for r in records
-                    if r[key] == value
-                ]
-            return [Member(**r, database=self) for r in records]
-
-    @contextmanager
-    def _open_read(self):
-        with open(self._path, newline='') as fs:
-            yield csv.DictReader(
-                fs,
-                dialect=self._DIALECT,
-                fieldnames=self._FIELDS,
-            )
+        return records
+
+    def sample(self, status: str, k: int) -> List[Dict[str, str]]:
+        """
+        Pick up to k distinct random records with given status, for
+        read-only access.
+
+        Parameters
+        ----------
+        status : str
+            Status of records.
+        k : int
+            Maximum number of records.
+
+        Returns
+        -------
+        List[Dict[str, str]]:
+            Copies of records.
+
+        Raises
+        ------
+        IndexError
+            If there are no records with given status.
+        """
+        with self._lock:
+            ids = tuple(self._by_status.get(status, ()))
+            if not ids:
+                raise IndexError('No records with given status')
+            return [
+                dict(self._records[id])
+                for id in random.sample(ids, min(k, len(ids)))
+            ]
+
+    def _format(self, records: Iterable[Dict[str, str]]) -> str:
+        return ''.join(['\t'.join(self._ROW(r)) + '\n' for r in records])
 
-    @contextmanager
-    def _open_write(self, append=False):
-        with open(self._path, 'a' if append else 'w', newline='') as fs:
-            yield csv.DictWriter(
-                fs,
-                dialect=self._DIALECT,
-                fieldnames=self._FIELDS,
+    def _append(self, records: List[Dict[str, str]]):
+        if self._fd is None:
+            self._fd = os.open(
+                self._path,
+                os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC,
+                0o600,
             )
+        os.write(self._fd, self._format(records).encode('utf-8'))
 
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -1,20 +1,49 @@
+import sys
 import random
+import shutil
+import tempfile
 import time
 import threading as th
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict, Any, BinaryIO, Union
 from urllib.parse import urljoin
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    TimeoutError,
+    as_completed,
+    wait,
+)
 
 from util import *
 from members import *
 from http_data_node import HttpDataNode
 
 
-def track_members(db: MemberDB, interval: int, stop_event: th.Event):
+BOOTSTRAP_WORKERS = 4
+BOOTSTRAP_MAX_BACKOFF = 60.0
+
+
+def track_members(
+    db: MemberDB,
+    interval: int,
+    stop_event: th.Event,
+    executor: ThreadPoolExecutor,
+):
     """
     Main function of heartbeat thread of NameNode.
 
     It walks through database, initializes new nodes, checks if nodes
     are alive and synchronizes nodes that have been dead but came back.
+    Node is synchronized from random alive donor with single bootstrap
+    request. If there are no alive nodes, new node is just formatted,
+    and node that comes back keeps its data, as it may hold the last
+    copy. Bootstraps run in separate threads, so that long copy does
+    not delay status checks of other nodes, and node is marked alive
+    on first check after its bootstrap completed. Node that fails to
+    bootstrap keeps its status and is retried after backoff, doubled
+    on every failure up to BOOTSTRAP_MAX_BACKOFF.
+    Members are read once per check, pinged concurrently and status
+    changes are saved together once check is done. Nodes that do not
+    answer ping within interval are considered dead.
 
     Parameters
     ----------
@@ -24,40 +53,95 @@ def track_members(db: MemberDB, interval: int, stop_event: th.Event):
         Interval of checks.
     stop_event : threading.Event
         Notification of main thread cleanup and exit.
+    executor : ThreadPoolExecutor
+        Executor to check if nodes are alive concurrently, separate
+        from one serving requests.
     """
-    while True:
-        members = db.filter()
-        for m in members:
-            node = HttpDataNode(m.url)
-            if m.status == NEW:
+    clients = {}
+    pool = ConnectionPool(interval)
+    bootstrapper = ThreadPoolExecutor(
+        BOOTSTRAP_WORKERS,
+        thread_name_prefix='bootstrap',
+    )
+    running = {}
+    backoff = {}
+
+    def client(url):
+        node = clients.get(url)
+        if node is None:
+            node = clients[url] = HttpDataNode(url, pool)
+        return node
+
+    def ping(m):
+        return client(m['url']).ping_alive()
+
+    def bootstrap(m, alive):
+        node = client(m['url'])
+        try:
+            donor = random.choice(alive)
+        except IndexError:
+            if m['status'] == NEW:
                 node.mkfs()
-                try:
-                    donor = random.choice(db.filter(status=ALIVE))
-                    node.sync(donor.url)
-                    donor_node = HttpDataNode(donor.url)
-                    node.cd(donor_node.stat('.')[0])
-                except IndexError as e:
-                    continue
-                finally:
-                    m.status = ALIVE
-            else:
-                if node.ping_alive():
-                    if m.status == DEAD:
-                        node.mkfs()
-                        try:
-                            donor = random.choice(db.filter(status=ALIVE))
-                            node.sync(donor.url)
-                            donor_node = HttpDataNode(donor.url)
-                            node.cd(donor_node.stat('.')[0])
-                        except IndexError as e:
-                            continue
-                        finally:
-                            m.status = ALIVE
-                else:
-                    m.status = DEAD
-        if stop_event.is_set():
             return
-        time.sleep(interval)
+        node.bootstrap(donor['url'])
+
+    def bootstrapped(m, alive):
+        node_id = m['id']
+        future = running.get(node_id)
+        if future is None:
+            if time.monotonic() >= backoff.get(node_id, (0, 0))[0]:
+                running[node_id] = bootstrapper.submit(
+                    bootstrap,
+                    m,
+                    list(alive),
+                )
+            return False
+        if not future.done():
+            return False
+        del running[node_id]
+        e = future.exception()
+        if e is None:
+            backoff.pop(node_id, None)
+            return True
+        delay = backoff[node_id][1] * 2 if node_id in backoff else interval
+        delay = min(delay, BOOTSTRAP_MAX_BACKOFF)
+        backoff[node_id] = (time.monotonic() + delay, delay)
+        print(
+            f'Failed to bootstrap data node {node_id}: {e!r}',
+            file=sys.stderr,
+        )
+        return False
+
+    try:
+        while True:
+            started = time.monotonic()
+            members = db.filter_records()
+            alive = [m for m in members if m['status'] == ALIVE]
+            probed = [m for m in members if m['status'] != NEW]
+            futures = [executor.submit(ping, m) for m in probed]
+            done, _ = wait(futures, timeout=interval)
+            pings = {
+                m['id']: f in done and not f.exception() and f.result()
+                for (m, f) in zip(probed, futures)
+            }
+            updates = []
+            try:
+                for m in members:
+                    status = m['status']
+                    if status == NEW or status == DEAD and pings[m['id']]:
+                        if bootstrapped(m, alive):
+                            updates.append({'id': m['id'], 'status': ALIVE})
+                            alive.append(m)
+                    elif status != DEAD and not pings[m['id']]:
+                        updates.append({'id': m['id'], 'status': DEAD})
+                        alive.remove(m)
+            finally:
+                db.update_many(updates)
+            elapsed = time.monotonic() - started
+            if stop_event.wait(max(interval - elapsed, 0)):
+                return
+    finally:
+        bootstrapper.shutdown(wait=False)
 
 
 class NameNode:
@@ -70,6 +154,19 @@ class NameNode:
     ----------------
     DEFAULT_HEARTBEAT : int
         Default interval of data node status checks.
+    FANOUT_WORKERS : int
+        Maximum number of data nodes requested concurrently.
+    FANOUT_TIMEOUT : float
+        Seconds to wait for data nodes to complete request, after
+        which data nodes that did not respond are marked dead. Also
+        socket timeout of requests to data nodes, so that worker
+        waiting for such data node is released.
+    HEARTBEAT_WORKERS : int
+        Maximum number of data nodes pinged concurrently.
+    REDIRECT_CANDIDATES : int
+        Number of data nodes pinged to select one for read operation.
+    REDIRECT_TIMEOUT : float
+        Seconds to wait for any of candidates to answer ping.
     HANDLERS : dict
         Dictionary where keys are HTTP endpoints and values are tuples
         of three elements: method to call, argument deserialization
@@ -77,6 +174,11 @@ class NameNode:
     """
 
     DEFAULT_HEARTBEAT = 1
+    FANOUT_WORKERS = 32
+    FANOUT_TIMEOUT = 30.0
+    HEARTBEAT_WORKERS = 16
+    REDIRECT_CANDIDATES = 2
+    REDIRECT_TIMEOUT = 1.0
 
     @staticmethod
     def get_args(env: os.environ) -> tuple:
@@ -109,15 +211,177 @@ class NameNode:
         """
         self._heartbeat_stop = None
         self._heartbeat = None
+        self._heartbeat_interval = None
+        self._db = None
+        self._executor = None
+        self._heartbeat_executor = None
+        self._clients = {}
+        self._pool = ConnectionPool(self.FANOUT_TIMEOUT)
         self._db = MemberDB(db_path)
-        heartbeat = heartbeat or self.DEFAULT_HEARTBEAT
+        self._executor = ThreadPoolExecutor(self.FANOUT_WORKERS)
+        self._heartbeat_executor = ThreadPoolExecutor(
+            self.HEARTBEAT_WORKERS,
+            thread_name_prefix='heartbeat',
+        )
+        self._heartbeat_interval = float(heartbeat or self.DEFAULT_HEARTBEAT)
         self._heartbeat_stop = th.Event()
         self._heartbeat = th.Thread(
             target=track_members,
-            args=(self._db, heartbeat, self._heartbeat_stop),
+            args=(
+                self._db,
+                self._heartbeat_interval,
+                self._heartbeat_stop,
+                self._heartbeat_executor,
+            ),
+            daemon=True,
         )
         self._heartbeat.start()
 
+    def close(self):
+        """
+        Stop heartbeat thread, shut down executors and close member
+        database. Heartbeat is waited for at most two intervals, it
+        is daemon thread and does not block exit if it hangs on
+        request to data node. Safe to call more than once.
+        """
+        if self._heartbeat:
+            self._heartbeat_stop.set()
+            self._heartbeat.join(2 * self._heartbeat_interval)
+            self._heartbeat = None
+        if self._heartbeat_executor:
+            self._heartbeat_executor.shutdown(wait=False)
+            self._heartbeat_executor = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._db:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def _client(self, url: str) -> HttpDataNode:
+        """
+        Get client of data node, created once per data node URL.
+
+        Parameters
+        ----------
+        url : str
+            URL of data node.
+
+        Returns
+        -------
+        HttpDataNode:
+            Client of data node.
+        """
+        node = self._clients.get(url)
+        if node is None:
+            node = self._clients[url] = HttpDataNode(url, self._pool)
+        return node
+
+    def _fanout(
+        self,
+        method: str,
+        *args,
+    ) -> List[Tuple[Dict[str, str], Any]]:
+        """
+        Call method on all alive data nodes concurrently.
+
+        Data nodes that can not be connected to or do not respond in
+        FANOUT_TIMEOUT are marked dead, so that heartbeat resyncs them
+        once they respond again, and call succeeds if any data node
+        completed it. Errors reported by data nodes themselves,
+        including server errors, and connections dropped during
+        request are raised without marking any data node dead, as
+        they are usually same on every data node or caused by client.
+
+        Parameters
+        ----------
+        method : str
+            Name of HttpDataNode method.
+        args : list
+            Arguments of method.
+
+        Returns
+        -------
+        List[Tuple[Dict[str, str], Any]]:
+            Pairs of member record and result of method call, for data
+            nodes that completed it.
+
+        Raises
+        ------
+        CommandError
+            First error reported by data node, in order of members, or
+            if no data node completed call.
+        """
+        nodes = self._db.filter_records(status=ALIVE)
+        if not nodes:
+            return []
+        futures = [
+            self._executor.submit(
+                getattr(self._client(node['url']), method),
+                *args,
+            )
+            for node in nodes
+        ]
+        done, _ = wait(futures, timeout=self.FANOUT_TIMEOUT)
+        results = []
+        failed = []
+        error = None
+        for (node, future) in zip(nodes, futures):
+            if future not in done:
+                failed.append({'id': node['id'], 'status': DEAD})
+                continue
+            e = future.exception()
+            if e is None:
+                results.append((node, future.result()))
+            elif is_unreachable(e):
+                failed.append({'id': node['id'], 'status': DEAD})
+            elif error is None:
+                error = e
+        self._db.update_many(failed)
+        if error is not None:
+            raise error
+        if not results:
+            raise CommandError('No data node completed request')
+        return results
+
+    def _pick(self) -> Dict[str, str]:
+        """
+        Select data node to redirect read operation to.
+
+        Several random alive data nodes are pinged concurrently and
+        the first to answer is selected, so that reads are not sent to
+        data node that is slow or went down since last heartbeat. If
+        none answers in REDIRECT_TIMEOUT, first candidate is selected.
+
+        Returns
+        -------
+        Dict[str, str]:
+            Member record of selected data node.
+        """
+        nodes = self._db.sample(ALIVE, self.REDIRECT_CANDIDATES)
+        if len(nodes) == 1:
+            return nodes[0]
+        futures = {
+            self._executor.submit(self._client(node['url']).ping_alive): node
+            for node in nodes
+        }
+        try:
+            for future in as_completed(futures, self.REDIRECT_TIMEOUT):
+                if future.result():
+                    return futures[future]
+        except TimeoutError:
+            pass
+        return nodes[0]
+
     def add_node(self, public_url: str, url: str, node_id: str):
         """
         Add data node to members database with status NEW.
@@ -142,12 +406,10 @@ class NameNode:
         List[Tuple[str, str]]:
             Array of pairs with data node id and its status.
         """
-        return [(n.id, n.status) for n in self._db.filter()]
+        return [(n['id'], n['status']) for n in self._db.filter_records()]
 
     def mkfs(self):
-        nodes = self._db.filter(status=ALIVE)
-        for node in nodes:
-            HttpDataNode(node.url).mkfs()
+        self._fanout('mkfs')
 
     def df(self) -> List[Tuple[str, int, int, int]]:
         """
@@ -158,18 +420,13 @@ class NameNode:
         List[Tuple[str, int, int, int]]:
             Array of node id, total, used, and free bytes.
         """
-        nodes = self._db.filter(status=ALIVE)
-        total = []
-        for node in nodes:
-            total.append(
-                (node.id, *HttpDataNode(node.url).df())
-            )
-        return total
+        return [
+            (node['id'], *usage)
+            for (node, usage) in self._fanout('df')
+        ]
 
     def cd(self, path: str):
-        nodes = self._db.filter(status=ALIVE)
-        for node in nodes:
-            HttpDataNode(node.url).cd(path)
+        self._fanout('cd', path)
 
     def ls(self, path: Optional[str] = None) -> str:
         """
@@ -188,23 +445,38 @@ class NameNode:
         str:
             URL to action on healthy data node.
         """
-        node = random.choice(self._db.filter(status=ALIVE))
-        return urljoin(node.public_url, 'ls')
+        node = self._pick()
+        return urljoin(node['public_url'], 'ls')
+
+    def ls_stat(self, path: Optional[str] = None) -> str:
+        """
+        Get endpoint for reading directory along with size and mode
+        of each entry.
+
+        Selects healthy data node and redirects user to read actual
+        results from there.
+
+        Parameters
+        ----------
+        path : Optional[str]
+            Path to directory.
+
+        Returns
+        -------
+        str:
+            URL to action on healthy data node.
+        """
+        node = self._pick()
+        return urljoin(node['public_url'], 'ls_stat')
 
     def mkdir(self, path: str):
-        nodes = self._db.filter(status=ALIVE)
-        for node in nodes:
-            HttpDataNode(node.url).mkdir(path)
+        self._fanout('mkdir', path)
 
     def rmdir(self, path: str, force: Optional[bool] = False):
-        nodes = self._db.filter(status=ALIVE)
-        for node in nodes:
-            HttpDataNode(node.url).rmdir(path, force)
+        self._fanout('rmdir', path, force)
 
     def touch(self, path: str):
-        nodes = self._db.filter(status=ALIVE)
-        for node in nodes:
-            HttpDataNode(node.url).touch(path)
+        self._fanout('touch', path)
 
     def cat(self, path: str) -> str:
         """
@@ -223,18 +495,59 @@ class NameNode:
         str:
             URL to action on healthy data node.
         """
-        node = random.choice(self._db.filter(status=ALIVE))
-        return urljoin(node.public_url, 'cat')
+        node = self._pick()
+        return urljoin(node['public_url'], 'cat')
+
+    def cat_range(self, path: str, offset: int, size: int) -> str:
+        """
+        Get endpoint for reading part of file.
+
+        Selects healthy data node and redirects user to read actual
+        results from there.
 
-    def tee(self, path: str, data: bytes):
-        nodes = self._db.filter(status=ALIVE)
-        for node in nodes:
-            HttpDataNode(node.url).tee(path, data)
+        Parameters
+        ----------
+        path : str
+            Path to file.
+        offset : int
+            Position in file to start reading from.
+        size : int
+            Maximum number of bytes to read.
+
+        Returns
+        -------
+        str:
+            URL to action on healthy data node.
+        """
+        node = self._pick()
+        return urljoin(node['public_url'], 'cat_range')
+
+    def tee(self, path: str, data: Union[bytes, BinaryIO]):
+        """
+        Write data to file on all alive data nodes.
+
+        Data streamed from file-like object is spooled to anonymous
+        temporary file instead of memory, so that it is read from
+        client once and sent to data nodes without buffering it whole.
+
+        Parameters
+        ----------
+        path : str
+            Path to file.
+        data : Union[bytes, BinaryIO]
+            Data to write, or readable file-like object to stream data
+            from.
+        """
+        if not hasattr(data, 'read'):
+            self._fanout('tee', path, data)
+            return
+        with tempfile.TemporaryFile() as spool:
+            shutil.copyfileobj(data, spool, WRITE_BLOCK_SIZE)
+            spool.flush()
+            self._fanout('tee', path, spool)
 
     def rm(self, path: str):
-        nodes = self._db.filter(status=ALIVE)
-        for node in nodes:
-            HttpDataNode(node.url).rm(path)
+        self._fanout('rm', path)
 
     def stat(self, path: str) -> str:
         """
@@ -253,18 +566,14 @@ class NameNode:
         str:
             URL to action on healthy data node.
         """
-        node = random.choice(self._db.filter(status=ALIVE))
-        return urljoin(node.public_url, 'stat')
+        node = self._pick()
+        return urljoin(node['public_url'], 'stat')
 
     def cp(self, src: str, dst: str):
-        nodes = self._db.filter(status=ALIVE)
-        for node in nodes:
-            HttpDataNode(node.url).cp(src, dst)
+        self._fanout('cp', src, dst)
 
     def mv(self, src: str, dst: str):
-        nodes = self._db.filter(status=ALIVE)
-        for node in nodes:
-            HttpDataNode(node.url).mv(src, dst)
+        self._fanout('mv', src, dst)
 
     def ping_alive(self):
         return True
@@ -277,11 +586,13 @@ class NameNode:
         '/df': (df, deserialize, serialize_matrix),
         '/cd': (cd, deserialize, serialize),
         '/ls': (ls, deserialize, serialize),
+        '/ls_stat': (ls_stat, deserialize, serialize),
         '/mkdir': (mkdir, deserialize, serialize),
         '/rmdir': (rmdir, deserialize, serialize),
         '/touch': (touch, deserialize, serialize),
-        '/cat': (cat, deserialize, serialize),
-        '/tee': (tee, deserialize, serialize),
+        '/cat': (cat, deserialize_path, serialize),
+        '/cat_range': (cat_range, deserialize_range, serialize),
+        '/tee': (tee, deserialize_stream, serialize),
         '/rm': (rm, deserialize, serialize),
         '/stat': (stat, deserialize, serialize),
         '/cp': (cp, deserialize, serialize),
@@ -291,8 +602,3 @@ class NameNode:
         '/ping_alive': (ping_alive, deserialize, serialize),
     }
 
-    def __del__(self):
-        if self._heartbeat:
-            self._heartbeat_stop.set()
-            self._heartbeat.join()
-
@@ -1,18 +1,156 @@
 #!/usr/bin/env python3
 import os
-from wsgiref.simple_server import make_server
-from wsgiref.util import request_uri
-from urllib.parse import urlparse
+import socket
+from io import UnsupportedOperation
+from http.server import BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import (
+    make_server,
+    ServerHandler,
+    WSGIRequestHandler,
+    WSGIServer,
+)
 
-from util import CommandError, import_class
+from util import BodyReader, CommandError, import_class, drop_cache
+
+
+FILE_BLOCK_SIZE = 64 * 1024
+KEEPALIVE_TIMEOUT = 10.0
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """
+    WSGI server that serves each connection in its own thread, so that
+    slow request, like name node waiting for data nodes, does not
+    block other clients.
+    """
+
+    daemon_threads = True
+
+
+class SendfileServerHandler(ServerHandler):
+    """
+    Server handler that transmits files returned through
+    wsgi.file_wrapper with sendfile instead of copying them
+    through python buffers. Responses are sent as HTTP/1.1, so that
+    clients can keep connection open.
+    """
+
+    http_version = '1.1'
+
+    def sendfile(self):
+        try:
+            in_fd = self.result.filelike.fileno()
+            self.stdout.fileno()
+        except (AttributeError, OSError, UnsupportedOperation):
+            return False
+        if not self.headers_sent:
+            self.send_headers()
+        self._flush()
+        sent = self.request_handler.connection.sendfile(self.result.filelike)
+        self.bytes_sent += sent
+        drop_cache(in_fd, sent)
+        return True
+
+    def cleanup_headers(self):
+        super().cleanup_headers()
+        if not self.request_handler.close_connection:
+            body = self.stdin
+            while body.remaining and body.read(FILE_BLOCK_SIZE):
+                pass
+            if body.remaining:
+                self.request_handler.close_connection = True
+        if self.request_handler.close_connection:
+            self.headers['Connection'] = 'close'
+
+    def handle_error(self):
+        if self.headers_sent:
+            self.request_handler.close_connection = True
+        super().handle_error()
+
+
+class SendfileRequestHandler(WSGIRequestHandler):
+    """
+    Request handler that serves requests with SendfileServerHandler.
+
+    Connection is kept open for next request, until client closes it
+    or stays idle for KEEPALIVE_TIMEOUT. Unread rest of request body
+    is discarded before response is sent, so that client which sends
+    whole body before reading response receives error of rejected
+    request instead of broken connection. Connection is closed after
+    response that could not be sent whole. Nagle's algorithm is
+    disabled, as status line, headers and body are written separately.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    disable_nagle_algorithm = True
+
+    handle = BaseHTTPRequestHandler.handle
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+            if not self.raw_requestline:
+                self.close_connection = True
+                return
+            if len(self.raw_requestline) > 65536:
+                self.requestline = ''
+                self.request_version = ''
+                self.command = ''
+                self.send_error(414)
+                return
+            if not self.parse_request():
+                return
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                self.send_error(400, 'Invalid Content-Length')
+                return
+            body = BodyReader(b'', self.rfile, length)
+            handler = SendfileServerHandler(
+                body,
+                self.wfile,
+                self.get_stderr(),
+                self.get_environ(),
+                multithread=True,
+            )
+            handler.request_handler = self
+            handler.run(self.server.get_app())
+            if body.remaining:
+                self.close_connection = True
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+
+
+def bind_handlers(node) -> dict:
+    """
+    Bind node HANDLERS to node once, so that requests are dispatched
+    without per-request method binding.
+
+    Parameters
+    ----------
+    node : object
+        Node instance with HANDLERS table.
+
+    Returns
+    -------
+    dict:
+        Dictionary where keys are HTTP endpoints and values are tuples
+        of bound method, argument deserialization routine and return
+        value serialization routine.
+    """
+    return {
+        path: (command.__get__(node), deserialize, serialize)
+        for path, (command, deserialize, serialize)
+        in node.HANDLERS.items()
+    }
 
 
 def route_request(env, start_response):
-    node = env['DFS_NODE_CLASS']
-    uri = request_uri(env).rstrip('/')
-    path = urlparse(uri).path
+    path = env.get('PATH_INFO', '').rstrip('/')
     try:
-        command, deserialize, serialize = node.HANDLERS[path]
+        command, deserialize, serialize = env['DFS_HANDLERS'][path]
     except KeyError:
         start_response(
             '404 Not Found',
@@ -25,32 +163,45 @@ def route_request(env, start_response):
         env['REMOTE_ADDR'],
     )
     try:
-        resp = command(node, *args)
+        resp = command(*args)
     except CommandError as e:
         start_response(
             '400 Bad Request',
             [('Content-type', 'text/plain')],
         )
         return [str(e).encode('utf-8')]
+    body = serialize(resp)
+    if isinstance(body, bytes):
+        start_response(
+            '200 OK',
+            [('Content-type', 'application/octet-stream')],
+        )
+        return [body]
     start_response(
         '200 OK',
-        [('Content-type', 'application/octet-stream')],
+        [
+            ('Content-type', 'application/octet-stream'),
+            ('Content-Length', str(os.fstat(body.fileno()).st_size)),
+        ],
     )
-    return [serialize(resp)]
+    return env['wsgi.file_wrapper'](body, FILE_BLOCK_SIZE)
 
 
 if __name__ == '__main__':
     node_cls = import_class(os.environ['DFS_NODE_CLASS'])
-    node = node_cls(*node_cls.get_args(os.environ))
-
-    def wsgi_app(env, start_response):
-        env['DFS_NODE_CLASS'] = node
-        return route_request(env, start_response)
-
-    with make_server(
-        os.environ.get('DFS_HOST', '0.0.0.0'),
-        int(os.environ.get('DFS_PORT', '8180')),
-        wsgi_app,
-    ) as server:
-        server.serve_forever()
+    with node_cls(*node_cls.get_args(os.environ)) as node:
+        handlers = bind_handlers(node)
+
+        def wsgi_app(env, start_response):
+            env['DFS_HANDLERS'] = handlers
+            return route_request(env, start_response)
+
+        with make_server(
+            os.environ.get('DFS_HOST', '0.0.0.0'),
+            int(os.environ.get('DFS_PORT', '8180')),
+            wsgi_app,
+            server_class=ThreadingWSGIServer,
+            handler_class=SendfileRequestHandler,
+        ) as server:
+            server.serve_forever()
 
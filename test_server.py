@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from wsgiref.simple_server import make_server
+
+from server import (
+    SendfileRequestHandler,
+    ThreadingWSGIServer,
+    bind_handlers,
+    route_request,
+)
+from data_node import DataNode
+from http_data_node import HttpDataNode
+from util import CommandError, ConnectionPool
+
+
+class QuietRequestHandler(SendfileRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class RejectedTeeTest(unittest.TestCase):
+    """
+    Tee of large body rejected by data node before body is read has to
+    report error of data node, not broken connection.
+    """
+
+    SIZE = 8 * 1024 * 1024
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        fs_root = os.path.join(self.tmp, 'rootfs')
+        with open(fs_root + '.state', 'w') as f:
+            f.write('test\n')
+        self.node = DataNode(fs_root)
+        self.node.mkfs()
+        handlers = bind_handlers(self.node)
+
+        def wsgi_app(env, start_response):
+            env['DFS_HANDLERS'] = handlers
+            return route_request(env, start_response)
+
+        self.server = make_server(
+            '127.0.0.1',
+            0,
+            wsgi_app,
+            server_class=ThreadingWSGIServer,
+            handler_class=QuietRequestHandler,
+        )
+        threading.Thread(target=self.server.serve_forever).start()
+        self.client = HttpDataNode(
+            f'http://127.0.0.1:{self.server.server_port}/',
+            ConnectionPool(),
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.node.close()
+        shutil.rmtree(self.tmp)
+
+    def test_rejected_tee(self):
+        data = bytes(self.SIZE)
+        for _ in range(2):
+            with self.assertRaisesRegex(CommandError, 'does not exist'):
+                self.client.tee('/nodir/x', data)
+        self.client.tee('/x', data)
+        self.assertEqual(self.client.stat('/x')[1], self.SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
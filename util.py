@@ -8,16 +8,53 @@ ID_SYMBOLS : str
     Symbols used to generate data node id.
 ID_LENGTH : int
     Length of data node id.
+DROP_CACHE_SIZE : int
+    Size of file in bytes starting from which its pages are dropped
+    from page cache after it was read sequentially.
+PACKAGE_COMPRESS_LEVEL : int
+    zlib compression level of packaged filesystem snapshots.
+HASH_BLOCK_SIZE : int
+    Size of blocks in which files are read to compute digests.
+http_pool : ConnectionPool
+    Connection pool shared by HTTP clients of nodes.
 """
 import os
 import sys
-import csv
+import errno
+import gzip
+import hashlib
 import random
+import re
 import string
+import stat
+import shutil
+import socket
 import tarfile
-from typing import List, Any, Tuple
+import time
+from typing import (
+    List,
+    Dict,
+    Any,
+    Tuple,
+    BinaryIO,
+    Union,
+    Optional,
+    Callable,
+)
 from io import BytesIO, IOBase
 from importlib import import_module
+from functools import lru_cache
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from http.client import (
+    HTTPConnection,
+    HTTPSConnection,
+    HTTPException,
+    HTTPResponse,
+    RemoteDisconnected,
+)
+from urllib.error import URLError, HTTPError
+from urllib.parse import urlsplit, urljoin
 
 
 def path_join(first: str, *args: List[str]) -> str:
@@ -39,9 +76,11 @@ def path_join(first: str, *args: List[str]) -> str:
     return os.path.normpath(os.path.join(first, *args))
 
 
+@lru_cache(maxsize=None)
 def import_class(path: str) -> object:
     """
     Import python class using path in format 'package.subpackage.Class'.
+    Result is cached per path.
 
     Parameters
     ----------
@@ -80,63 +119,727 @@ def gen_id() -> str:
     str:
         Id of data node.
     """
-    return ''.join(random.choice(ID_SYMBOLS) for _ in range(ID_LENGTH))
+    return ''.join(random.choices(ID_SYMBOLS, k=ID_LENGTH))
 
 
-def package(path: str) -> bytes:
+DROP_CACHE_SIZE = 1024 * 1024
+
+
+def advise_sequential(fd: int):
     """
-    Tarball and gzip contents under path.
+    Hint kernel that file will be read sequentially, which increases
+    readahead window.
+
+    Parameters
+    ----------
+    fd : int
+        File descriptor.
+    """
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+
+def drop_cache(fd: int, size: int):
+    """
+    Drop pages of large file that was read once from page cache, so
+    that bulk reads do not evict metadata and small hot files.
+
+    Parameters
+    ----------
+    fd : int
+        File descriptor.
+    size : int
+        Number of bytes read from file.
+    """
+    if size >= DROP_CACHE_SIZE and hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+
+_NO_COPY_RANGE = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+}
+
+
+def copy_file(src: str, dst: str):
+    """
+    Copy file contents and permission bits inside the kernel.
+
+    Uses copy_file_range, which allows filesystems to share extents
+    instead of copying data, and falls back to sendfile where it is
+    not supported. If dst is a directory, file is copied into it.
+
+    Parameters
+    ----------
+    src : str
+        Source file path.
+    dst : str
+        Destination file or directory path.
+
+    Raises
+    ------
+    shutil.SameFileError
+        If src and dst are the same file, which is left intact.
+    """
+    src_fd = os.open(src, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        st = os.fstat(src_fd)
+        if stat.S_ISDIR(st.st_mode):
+            raise IsADirectoryError(
+                errno.EISDIR, os.strerror(errno.EISDIR), src,
+            )
+        flags = os.O_WRONLY | os.O_CREAT | os.O_CLOEXEC
+        mode = stat.S_IMODE(st.st_mode)
+        try:
+            dst_fd = os.open(dst, flags, mode)
+        except IsADirectoryError:
+            dst = os.path.join(dst, os.path.basename(src))
+            dst_fd = os.open(dst, flags, mode)
+        try:
+            dst_st = os.fstat(dst_fd)
+            if (dst_st.st_dev, dst_st.st_ino) == (st.st_dev, st.st_ino):
+                raise shutil.SameFileError(
+                    f'{src} and {dst} are the same file',
+                )
+            os.ftruncate(dst_fd, 0)
+            advise_sequential(src_fd)
+            remaining = st.st_size
+            use_range = hasattr(os, 'copy_file_range')
+            while remaining > 0:
+                if use_range:
+                    try:
+                        n = os.copy_file_range(src_fd, dst_fd, remaining)
+                    except OSError as e:
+                        if e.errno not in _NO_COPY_RANGE:
+                            raise
+                        use_range = False
+                        continue
+                else:
+                    n = os.sendfile(dst_fd, src_fd, None, remaining)
+                if n == 0:
+                    break
+                remaining -= n
+        finally:
+            os.close(dst_fd)
+        drop_cache(src_fd, st.st_size)
+    finally:
+        os.close(src_fd)
+
+
+_NO_TMPFILE = {
+    errno.EOPNOTSUPP,
+    errno.EISDIR,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOENT,
+}
+_use_tmpfile = None
+WRITE_BLOCK_SIZE = 64 * 1024
+
+
+def _tmp_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'.{name}.{gen_id()}')
+
+
+def _write(file: BinaryIO, data: Union[bytes, BinaryIO]):
+    if hasattr(data, 'read'):
+        shutil.copyfileobj(data, file, WRITE_BLOCK_SIZE)
+    else:
+        file.write(data)
+    file.flush()
+    fd = file.fileno()
+    fdatasync(fd)
+    drop_cache(fd, file.tell())
+
+
+def _open_tmpfile(directory: str) -> int:
+    return os.open(
+        directory,
+        os.O_TMPFILE | os.O_WRONLY | os.O_CLOEXEC,
+        0o666,
+    )
+
+
+def _probe_tmpfile(directory: str) -> bool:
+    if not hasattr(os, 'O_TMPFILE'):
+        return False
+    try:
+        fd = _open_tmpfile(directory)
+    except OSError as e:
+        if e.errno in _NO_TMPFILE and os.path.isdir(directory):
+            return False
+        raise
+    tmp_path = _tmp_path(os.path.join(directory, 'probe'))
+    try:
+        os.link(f'/proc/self/fd/{fd}', tmp_path)
+    except OSError as e:
+        if e.errno in _NO_TMPFILE:
+            return False
+        raise
+    finally:
+        os.close(fd)
+    os.remove(tmp_path)
+    return True
+
+
+def _link_tmpfile(path: str, data: Union[bytes, BinaryIO]):
+    fd = _open_tmpfile(os.path.dirname(path))
+    with open(fd, 'wb') as file:
+        _write(file, data)
+        fd_path = f'/proc/self/fd/{fd}'
+        try:
+            os.link(fd_path, path)
+            return
+        except FileExistsError:
+            tmp_path = _tmp_path(path)
+            os.link(fd_path, tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+
+def write_file(path: str, data: Union[bytes, BinaryIO]):
+    """
+    Replace file contents atomically, so that readers never observe
+    partially written file.
+
+    Data is written to anonymous O_TMPFILE file in target directory,
+    which is then linked into place. If target already exists file
+    is linked under temporary name and renamed over target. Where
+    O_TMPFILE can not be linked, named temporary file is used.
+    Support is probed once on first call.
+
+    Data is flushed to disk before file is put in place, so that crash
+    leaves either old or new contents. Pages of large files are then
+    dropped from page cache, as written data is rarely read back soon.
 
     Parameters
     ----------
     path : str
-        Path to directory of file to package.
+        Path to file.
+    data : Union[bytes, BinaryIO]
+        Data to write, or readable file-like object to copy data from.
+    """
+    global _use_tmpfile
+    if _use_tmpfile is None:
+        _use_tmpfile = _probe_tmpfile(os.path.dirname(path))
+    if _use_tmpfile:
+        _link_tmpfile(path, data)
+        return
+    tmp_path = _tmp_path(path)
+    fd = os.open(
+        tmp_path,
+        os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC,
+        0o666,
+    )
+    try:
+        with open(fd, 'wb') as file:
+            _write(file, data)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+
+class BodyReader:
+    """
+    Readable file-like object over rest of request body, that first
+    returns bytes already consumed from stream and then reads at
+    most remaining length of body from stream.
+    """
+
+    def __init__(self, prefix: bytes, stream: IOBase, length: int):
+        self._prefix = prefix
+        self._stream = stream
+        self._length = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self._prefix:
+            if size < 0 or size >= len(self._prefix):
+                data, self._prefix = self._prefix, b''
+                if size >= 0:
+                    size -= len(data)
+            else:
+                data = self._prefix[:size]
+                self._prefix = self._prefix[size:]
+                return data
+        else:
+            data = b''
+        if size < 0 or size > self._length:
+            size = self._length
+        if size:
+            chunk = self._stream.read(size)
+            self._length -= len(chunk)
+            data += chunk
+        return data
+
+    @property
+    def remaining(self) -> int:
+        """
+        Number of bytes of body not read yet.
+        """
+        return len(self._prefix) + self._length
+
+
+@lru_cache(maxsize=256)
+def endpoints(url: str, names: Tuple[str, ...]) -> Dict[str, str]:
+    """
+    Build URLs of node server endpoints. Result is cached, as clients
+    of same node are created repeatedly.
+
+    Parameters
+    ----------
+    url : str
+        URL of node server.
+    names : Tuple[str, ...]
+        Names of endpoints.
 
     Returns
     -------
-    bytes:
-        Compressed tarball of given path.
+    Dict[str, str]:
+        Mapping of endpoint names to their full URLs. It is shared
+        between callers and must not be modified.
+    """
+    return {name: urljoin(url, '/' + name) for name in names}
+
+
+def _body_size(part: Union[bytes, BinaryIO]) -> int:
+    if hasattr(part, 'fileno'):
+        return os.fstat(part.fileno()).st_size
+    return len(part)
+
+
+def _send_file(conn: HTTPConnection, file: BinaryIO):
+    # Positional reads leave file offset untouched, so that same file
+    # can be sent to several nodes concurrently.
+    fd = file.fileno()
+    offset = 0
+    chunk = os.pread(fd, WRITE_BLOCK_SIZE, offset)
+    while chunk:
+        conn.send(chunk)
+        offset += len(chunk)
+        chunk = os.pread(fd, WRITE_BLOCK_SIZE, offset)
+
+
+@lru_cache(maxsize=1024)
+def _split_url(url: str) -> Tuple[Tuple[str, str], str, str]:
+    parts = urlsplit(url)
+    target = parts.path or '/'
+    if parts.query:
+        target += '?' + parts.query
+    return (parts.scheme, parts.netloc), target, parts.hostname
+
+
+class ConnectionPool:
     """
-    packaged = BytesIO()
-    with tarfile.open(fileobj=packaged, mode='w|gz') as tar:
-        tar.add(path, '/')
-    return packaged.getvalue()
+    Keep-alive HTTP connections keyed by scheme and host, so that
+    repeated requests to same node reuse TCP connection instead of
+    connecting on every call. Connections are taken out of pool for
+    duration of request, so pool can be shared between threads.
 
+    Errors are raised same as by urlopen: HTTPError for error
+    responses and URLError when node can not be reached or connection
+    is dropped. Response sent by node that closed connection before
+    request body was sent whole is still read and returned.
 
-def unpack(package: bytes, path: str):
+    Class Attributes
+    ----------------
+    MAX_IDLE : int
+        Maximum number of idle connections kept per host.
+    IDLE_TIMEOUT : float
+        Seconds after which idle connection is closed instead of
+        reused, as server has likely closed it already.
+    TIMEOUT : float
+        Default socket timeout, so that node which accepts connection
+        but never answers does not hold calling thread forever.
     """
-    Read package as gzip compressed tarball and extract its contents
-    to path.
+
+    MAX_IDLE = 8
+    IDLE_TIMEOUT = 3.0
+    TIMEOUT = 60.0
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Create empty pool.
+
+        Parameters
+        ----------
+        timeout : Optional[float]
+            Socket timeout of requests. If not specified uses TIMEOUT
+            value.
+        """
+        self._idle = {}
+        self._timeout = timeout or self.TIMEOUT
+
+    def _connect(
+        self,
+        key: Tuple[str, str],
+        timeout: float,
+    ) -> HTTPConnection:
+        scheme, netloc = key
+        if scheme == 'https':
+            return HTTPSConnection(netloc, timeout=timeout)
+        return HTTPConnection(netloc, timeout=timeout)
+
+    def _send(
+        self,
+        conn: HTTPConnection,
+        method: str,
+        target: str,
+        data: Union[None, bytes, Tuple[Union[bytes, BinaryIO], ...]],
+    ):
+        if not isinstance(data, tuple):
+            conn.request(method, target, body=data)
+            return
+        length = sum(map(_body_size, data))
+        streamed = any(hasattr(part, 'fileno') for part in data)
+        if length < WRITE_BLOCK_SIZE and not streamed:
+            conn.request(method, target, body=b''.join(data))
+            return
+        conn.putrequest(method, target)
+        conn.putheader('Content-Length', str(length))
+        if hasattr(data[0], 'fileno'):
+            conn.endheaders()
+            parts = data
+        else:
+            conn.endheaders(data[0])
+            parts = data[1:]
+        for part in parts:
+            if hasattr(part, 'fileno'):
+                _send_file(conn, part)
+            else:
+                conn.send(part)
+
+    def _exchange(
+        self,
+        conn: HTTPConnection,
+        method: str,
+        target: str,
+        data: Union[None, bytes, Tuple[Union[bytes, BinaryIO], ...]],
+    ) -> HTTPResponse:
+        try:
+            self._send(conn, method, target, data)
+        except ConnectionError as e:
+            # Server may answer and close connection before whole body
+            # is sent, when it rejects request early, so its response
+            # is read before connection is considered broken.
+            if conn.sock is None:
+                raise
+            try:
+                resp = conn.getresponse()
+            except (OSError, HTTPException):
+                raise e
+            resp.will_close = True
+            return resp
+        return conn.getresponse()
+
+    def _acquire(self, key: Tuple[str, str]) -> Optional[HTTPConnection]:
+        idle = self._idle.get(key)
+        now = time.monotonic()
+        while idle:
+            try:
+                conn, released = idle.pop()
+            except IndexError:
+                break
+            if now - released < self.IDLE_TIMEOUT:
+                return conn
+            conn.close()
+        return None
+
+    def _release(self, key: Tuple[str, str], conn: HTTPConnection):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.MAX_IDLE:
+            idle.append((conn, time.monotonic()))
+        else:
+            conn.close()
+
+    @contextmanager
+    def open(
+        self,
+        url: str,
+        data: Union[None, bytes, Tuple[Union[bytes, BinaryIO], ...]] = None,
+        timeout: Optional[float] = None,
+    ):
+        """
+        Send request and yield response. Connection is returned to
+        pool once response is read to the end.
+
+        Parameters
+        ----------
+        url : str
+            Full URL of request.
+        data : Union[None, bytes, Tuple[Union[bytes, BinaryIO], ...]]
+            Request body. POST is sent if given, GET otherwise. Body
+            given as tuple of parts is sent part by part, without
+            joining parts into one buffer. Parts that are files are
+            sent whole from start, regardless of file position.
+        timeout : Optional[float]
+            Socket timeout of request. If not specified uses timeout
+            of pool.
+
+        Yields
+        ------
+        HTTPResponse:
+            Response with successful status.
+        """
+        key, target, _ = _split_url(url)
+        method = 'GET' if data is None else 'POST'
+        timeout = timeout or self._timeout
+        conn = self._acquire(key)
+        reused = conn is not None
+        if not reused:
+            conn = self._connect(key, timeout)
+        elif conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        try:
+            try:
+                resp = self._exchange(conn, method, target, data)
+            except (RemoteDisconnected, ConnectionError):
+                if not reused:
+                    raise
+                conn.close()
+                conn = self._connect(key, timeout)
+                resp = self._exchange(conn, method, target, data)
+        except (OSError, HTTPException) as e:
+            conn.close()
+            raise URLError(e)
+        resp.url = url
+        try:
+            if resp.status >= 400:
+                body = resp.read()
+            else:
+                yield resp
+                resp.read()
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        if resp.status >= 400:
+            raise HTTPError(
+                url,
+                resp.status,
+                resp.reason,
+                resp.headers,
+                BytesIO(body),
+            )
+
+    def request(
+        self,
+        url: str,
+        data: Union[None, bytes, Tuple[Union[bytes, BinaryIO], ...]] = None,
+        deserialize: Optional[Callable] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Send request to node server and read response.
+
+        Parameters
+        ----------
+        url : str
+            Full URL of request.
+        data : Union[None, bytes, Tuple[Union[bytes, BinaryIO], ...]]
+            Request body. POST is sent if given, GET otherwise. Body
+            given as tuple of parts is sent part by part, without
+            joining parts into one buffer. Parts that are files are
+            sent whole from start, regardless of file position.
+        deserialize : Optional[Callable]
+            Routine to deserialize response body with. If not
+            specified raw body is returned.
+        timeout : Optional[float]
+            Socket timeout of request. If not specified uses timeout
+            of pool.
+
+        Returns
+        -------
+        Any:
+            Deserialized response.
+
+        Raises
+        ------
+        CommandError
+            If node rejected request, with message from node.
+        """
+        try:
+            with self.open(url, data, timeout) as resp:
+                if deserialize is None:
+                    return resp.read()
+                return deserialize(
+                    resp,
+                    resp.length,
+                    _split_url(url)[2],
+                )
+        except HTTPError as e:
+            if e.code != 400:
+                raise
+            raise CommandError(e.read().decode('utf-8'))
+
+
+http_pool = ConnectionPool()
+
+
+_UNREACHABLE_ERRNOS = (errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN)
+
+
+def is_unreachable(e: BaseException) -> bool:
+    """
+    Check if request failed because node could not be connected to or
+    did not answer in time, as opposed to connection dropped while
+    request was exchanged or error reported by node itself.
+
+    Parameters
+    ----------
+    e : BaseException
+        Error raised by request.
+
+    Returns
+    -------
+    bool:
+        True if node is considered unreachable.
+    """
+    if not isinstance(e, URLError) or isinstance(e, HTTPError):
+        return False
+    reason = e.reason
+    if isinstance(
+        reason,
+        (socket.timeout, socket.gaierror, ConnectionRefusedError),
+    ):
+        return True
+    return getattr(reason, 'errno', None) in _UNREACHABLE_ERRNOS
+
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(path: str) -> str:
+    """
+    Compute SHA-256 digest of file contents.
+
+    Parameters
+    ----------
+    path : str
+        Path to file.
+
+    Returns
+    -------
+    str:
+        Hex encoded digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb', buffering=0) as f:
+        advise_sequential(f.fileno())
+        size = 0
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            size += len(block)
+        drop_cache(f.fileno(), size)
+    return digest.hexdigest()
+
+
+def manifest(path: str) -> List[Tuple[str, str]]:
+    """
+    List directories and regular files under path along with digests
+    of file contents. Symbolic links and special files are skipped.
+
+    Files are hashed in thread pool, as both reads and hashing release
+    GIL, so that disk reads of many files overlap.
+
+    Parameters
+    ----------
+    path : str
+        Path to directory.
+
+    Returns
+    -------
+    List[Tuple[str, str]]:
+        Sorted array of paths relative to given path, starting with
+        '/', and SHA-256 digests. Digest of directory is empty string.
+    """
+    entries = []
+    files = []
+    prefix_len = len(path.rstrip('/'))
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    entries.append((e.path[prefix_len:], ''))
+                    stack.append(e.path)
+                elif e.is_file(follow_symlinks=False):
+                    files.append(e.path)
+    with ThreadPoolExecutor() as executor:
+        digests = executor.map(file_digest, files)
+        entries.extend(zip((f[prefix_len:] for f in files), digests))
+    entries.sort()
+    return entries
+
+
+PACKAGE_COMPRESS_LEVEL = 6
+
+
+def package(path: str, fileobj: BinaryIO):
+    """
+    Tarball and gzip contents under path.
 
     Parameters
     ----------
-    package : bytes
-        Compressed tarball.
+    path : str
+        Path to directory of file to package.
+    fileobj : BinaryIO
+        Writable file-like object to stream compressed tarball to.
+    """
+    with gzip.GzipFile(
+        fileobj=fileobj,
+        mode='wb',
+        compresslevel=PACKAGE_COMPRESS_LEVEL,
+        mtime=0,
+    ) as compressed:
+        with tarfile.open(fileobj=compressed, mode='w|') as tar:
+            tar.add(path, '/')
+
+
+def unpack(fileobj: BinaryIO, path: str):
+    """
+    Read gzip compressed tarball and extract its contents to path.
+
+    Tarball is read sequentially, each member is extracted as soon as
+    it is read, so memory usage does not depend on package size.
+
+    Parameters
+    ----------
+    fileobj : BinaryIO
+        Readable file-like object with compressed tarball.
     path : str
         Path to extract contents.
+
+    Raises
+    ------
+    CommandError
+        If member of tarball would be extracted outside of path.
     """
-    packaged = BytesIO(package)
-    with tarfile.open(fileobj=packaged, mode='r|gz') as tar:
-        def is_within_directory(directory, target):
-            
-            abs_directory = os.path.abspath(directory)
-            abs_target = os.path.abspath(target)
-        
-            prefix = os.path.commonprefix([abs_directory, abs_target])
-            
-            return prefix == abs_directory
-        
-        def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-        
-            for member in tar.getmembers():
-                member_path = os.path.join(path, member.name)
-                if not is_within_directory(path, member_path):
-                    raise Exception("Attempted Path Traversal in Tar File")
-        
-            tar.extractall(path, members, numeric_owner=numeric_owner) 
-            
-        
-        safe_extract(tar, path)
+    root = os.path.abspath(path)
+    with tarfile.open(fileobj=fileobj, mode='r|gz') as tar:
+        for member in tar:
+            target = os.path.abspath(os.path.join(root, member.name))
+            if os.path.commonpath([root, target]) != root:
+                raise CommandError('Attempted Path Traversal in Tar File')
+            tar.extract(member, root)
+
+
+_SEPARATOR = re.compile(rb'[\0 ]')
 
 
 def deserialize(
@@ -150,7 +853,8 @@ def deserialize(
     Generic deserialization for following formats:
 
         1. single utf-8 string without whitespaces
-        2. utf-8 string and raw byte data separated by first zero byte
+        2. utf-8 string and raw byte data separated by first zero byte,
+           byte data is returned as memoryview to avoid copying it
         3. two utf-8 string separated by first space in stream
         4. utf-8 string and flag represented by single '!' and separated
            by space
@@ -169,39 +873,68 @@ def deserialize(
     Any:
         One of the options described above
     """
-    it = iter(stream.read(content_len))
-    has_blob = False
-    path = b''
-    for b in it:
-        b = bytes([b])
-        if b == b' ':
-            break
-        if b == b'\0':
-            has_blob = True
-            break
-        path += b
-    else:
-        return (path.decode('utf-8'),) if path else ()
-    path = path.decode('utf-8')
+    data = stream.read(content_len)
+    match = _SEPARATOR.search(data)
+    if match is None:
+        return (data.decode('utf-8'),) if data else ()
+    sep = match.start()
+    path = data[:sep].decode('utf-8')
+    if data[sep] == 0:
+        return path, memoryview(data)[sep + 1:]
+    rest = data[sep + 1:]
+    if rest == b'!':
+        return path, True
+    return path, rest.decode('utf-8')
+
 
-    if has_blob:
-        return path, bytes(it)
+def deserialize_stream(
+    stream: IOBase,
+    content_len: int,
+    remote_ip: str,
+) -> Tuple[str, BodyReader]:
+    """
+    Deserialize utf-8 string and raw byte data separated by first
+    zero byte, without reading byte data to memory.
 
-    b = bytes([next(it)])
-    if b == b'!':
-        nb = bytes([nnext(it)])
-        if not nb:
-            return path, True
-        b += nb
-    b += bytes(it)
-    return path, b.decode('utf-8')
+    Parameters
+    ----------
+    stream : IOBase
+        Stream of request body.
+    content_len : int
+        Length of request body.
+    remote_ip : str
+        IP address of client.
+
+    Returns
+    -------
+    Tuple[str, BodyReader]:
+        String and file-like object to read byte data from. If there
+        is no zero byte, tuple with only string is returned.
+    """
+    buf = b''
+    remaining = content_len
+    nul = -1
+    while nul == -1 and remaining:
+        chunk = stream.read(min(remaining, WRITE_BLOCK_SIZE))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        start = len(buf)
+        buf += chunk
+        nul = buf.find(b'\0', start)
+    if nul == -1:
+        return (buf.decode('utf-8'),) if buf else ()
+    return (
+        buf[:nul].decode('utf-8'),
+        BodyReader(buf[nul + 1:], stream, remaining),
+    )
 
 
 def serialize(data: Any) -> bytes:
     """
     Serialize data with generic method.
 
-    Serialization is done by converting to string andencoding with
+    Serialization is done by converting to string and encoding with
     utf-8 for non-iterable types, and by joining with space and utf-8
     encoding for iterable types.
 
@@ -215,17 +948,41 @@ def serialize(data: Any) -> bytes:
     bytes:
         Serialized data.
     """
-    if data == None:
+    if data is None:
         return b''
-    if type(data) == bytes:
+    if isinstance(data, bytes):
         return data
-    if type(data) == str:
+    if isinstance(data, str):
         return data.encode('utf-8')
+    if isinstance(data, (tuple, list)):
+        if len(data) == 2:
+            return f'{data[0]} {data[1]}'.encode('utf-8')
+        return ' '.join(map(str, data)).encode('utf-8')
+    if isinstance(data, (bytearray, memoryview)):
+        return bytes(data)
     try:
         iterator = iter(data)
     except TypeError:
         return str(data).encode('utf-8')
-    return ' '.join(str(x) for x in iterator).encode('utf-8')
+    return ' '.join(map(str, iterator)).encode('utf-8')
+
+
+def serialize_file(data: BinaryIO) -> BinaryIO:
+    """
+    Pass open file through as response body, so that server streams
+    it to client instead of reading it to memory.
+
+    Parameters
+    ----------
+    data : BinaryIO
+        File opened for reading.
+
+    Returns
+    -------
+    BinaryIO:
+        Same file.
+    """
+    return data
 
 
 def deserialize_tuple(
@@ -308,6 +1065,68 @@ def deserialize_stat(
     return tmp[0], int(tmp[1]), int(tmp[2])
 
 
+def deserialize_range(
+    stream: IOBase,
+    content_len: int,
+    remote_ip: str,
+) -> Tuple[str, int, int]:
+    """
+    Deserialize arguments of cat_range sent as offset, size and path
+    separated by spaces.
+
+    Parameters
+    ----------
+    stream : IOBase
+        Stream of request body.
+    content_len : int
+        Length of request body.
+    remote_ip : str
+        IP address of client.
+
+    Returns
+    -------
+    Tuple[str, int, int]:
+        Path, offset and size.
+    """
+    offset, size, path = stream.read(content_len).decode('utf-8').split(
+        ' ',
+        2,
+    )
+    return path, int(offset), int(size)
+
+
+def deserialize_entries(
+    stream: IOBase,
+    content_len: int,
+    remote_ip: str,
+) -> List[Tuple[str, int, int]]:
+    """
+    Deserialize directory entries returned by ls_stat.
+
+    Parameters
+    ----------
+    stream : IOBase
+        Stream of request body.
+    content_len : int
+        Length of request body.
+    remote_ip : str
+        IP address of client.
+
+    Returns
+    -------
+    List[Tuple[str, int, int]]:
+        Entry names, sizes and modes.
+    """
+    tmp = stream.read(content_len).decode('utf-8')
+    entries = []
+    for line in tmp.split('\n'):
+        if not line:
+            continue
+        name, size, mode = line.split('\t')
+        entries.append((name, int(size), int(mode)))
+    return entries
+
+
 def deserialize_matrix(
     stream: IOBase,
     content_len: int,
@@ -335,6 +1154,90 @@ def deserialize_matrix(
     return [l.split('\t') for l in lines]
 
 
+def deserialize_paths(
+    stream: IOBase,
+    content_len: int,
+    remote_ip: str,
+) -> Tuple[List[str]]:
+    """
+    Deserialize newline separated list of paths for batch requests.
+
+    Parameters
+    ----------
+    stream : IOBase
+        Stream of request body.
+    content_len : int
+        Length of request body.
+    remote_ip : str
+        IP address of client.
+
+    Returns
+    -------
+    Tuple[List[str]]:
+        Single argument tuple with list of paths.
+    """
+    tmp = stream.read(content_len).decode('utf-8')
+    return ([p for p in tmp.split('\n') if p],)
+
+
+def deserialize_path(
+    stream: IOBase,
+    content_len: int,
+    remote_ip: str,
+) -> Tuple[str]:
+    """
+    Deserialize whole body as single path, so that paths with spaces,
+    newlines or zero bytes are passed as is.
+
+    Parameters
+    ----------
+    stream : IOBase
+        Stream of request body.
+    content_len : int
+        Length of request body.
+    remote_ip : str
+        IP address of client.
+
+    Returns
+    -------
+    Tuple[str]:
+        Single argument tuple with path.
+    """
+    return (stream.read(content_len).decode('utf-8'),)
+
+
+def deserialize_stat_batch(
+    stream: IOBase,
+    content_len: int,
+    remote_ip: str,
+) -> List[Tuple[str, str, int, int]]:
+    """
+    Deserialize list of tuples returned by stat_batch.
+
+    Parameters
+    ----------
+    stream : IOBase
+        Stream of request body.
+    content_len : int
+        Length of request body.
+    remote_ip : str
+        IP address of client.
+
+    Returns
+    -------
+    List[Tuple[str, str, int, int]]:
+        Requested path, full path, size and mode.
+    """
+    tmp = stream.read(content_len).decode('utf-8')
+    result = []
+    for line in tmp.split('\n'):
+        if not line:
+            continue
+        path, full_path, size, mode = line.split('\t')
+        result.append((path, full_path, int(size), int(mode)))
+    return result
+
+
 def deserialize_join(
     stream: IOBase,
     content_len: int,
@@ -369,10 +1272,57 @@ def deserialize_join(
     return public_url, url, id
 
 
+def serialize_manifest(data: List[Tuple[str, str]]) -> bytes:
+    """
+    Serialize manifest entries, terminating path and digest of each
+    entry with zero byte, which can not appear in file names.
+
+    Parameters
+    ----------
+    data : List[Tuple[str, str]]
+        Paths and digests.
+
+    Returns
+    -------
+    bytes:
+        Serialized manifest.
+    """
+    entries = [f'{path}\0{digest}\0' for path, digest in data]
+    return ''.join(entries).encode('utf-8')
+
+
+def parse_manifest(data: bytes) -> List[Tuple[str, str]]:
+    """
+    Parse manifest serialized by serialize_manifest.
+
+    Parameters
+    ----------
+    data : bytes
+        Serialized manifest.
+
+    Returns
+    -------
+    List[Tuple[str, str]]:
+        Paths and digests.
+
+    Raises
+    ------
+    ValueError
+        If data is not valid manifest.
+    """
+    fields = data.decode('utf-8').split('\0')
+    if len(fields) % 2 != 1 or fields[-1]:
+        raise ValueError('Malformed manifest')
+    return list(zip(fields[0:-1:2], fields[1::2]))
+
+
 def serialize_matrix(data: List[List[str]]) -> bytes:
     """
     Serialize list of lists.
 
+    Rows are formatted with format string built once per row length,
+    so rows of different length keep all their columns.
+
     Parameters
     ----------
     data : List[List[str]]
@@ -383,6 +1333,12 @@ def serialize_matrix(data: List[List[str]]) -> bytes:
     bytes:
         Serialized lists.
     """
-    lines = ['\t'.join([str(y) for y in x]) for x in data]
+    rows = {}
+    lines = []
+    for x in data:
+        row = rows.get(len(x))
+        if row is None:
+            row = rows[len(x)] = '\t'.join(['{}'] * len(x)).format
+        lines.append(row(*x))
     return '\n'.join(lines).encode('utf-8')
 